@@ -1,9 +1,11 @@
 # app.py
 
 import streamlit as st
-import pandas as pd
+import csv
+import io
 import time
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 # =============================
 # Configuração da página
@@ -29,7 +31,9 @@ st.markdown(
 # Importações do projeto
 # =============================
 from sistema_demandas.config import (
-    TEMA_CORES, CORES_STATUS, CORES_PRIORIDADE, get_db_config, DATABASE_URL
+    TEMA_CORES, CORES_STATUS, CORES_PRIORIDADE, get_db_config, DATABASE_URL,
+    STATUS_DEMANDA, STATUS_INDEX, PRIORIDADES, NIVEIS_ACESSO, NIVEL_INDEX,
+    DEPARTAMENTOS, LOCAIS, CATEGORIAS, UNIDADES
 )
 from sistema_demandas.timezone_utils import (
     agora_fortaleza, _to_tz_aware_start, _to_tz_aware_end_exclusive
@@ -39,7 +43,7 @@ from sistema_demandas.migrations import init_database
 from sistema_demandas.data_access import (
     autenticar_usuario, criar_usuario, listar_usuarios, atualizar_usuario, desativar_usuario,
     carregar_demandas, obter_estatisticas, atualizar_demanda, excluir_demanda, adicionar_demanda,
-    carregar_historico_demanda
+    carregar_historico_demanda, carregar_historicos_demandas, iterar_demandas, listar_demandas_resumo, obter_demanda
 )
 
 # =============================
@@ -112,6 +116,39 @@ st.markdown(CSS_CUSTOM, unsafe_allow_html=True)
 # =============================
 # Helpers
 # =============================
+SESSAO_TTL_SEG = 30 * 60
+# Valores iniciais do session_state, aplicados uma vez no início de cada rerun
+SESSAO_PADRAO = {
+    "pagina_atual": "inicio",
+    "usuario_logado": False,
+    "solicitacao_enviada": False,
+    "ultima_demanda_codigo": None,
+    "kb_open_codigo": None,
+}
+TAMANHO_PAGINA_ADMIN = 50
+LIMITE_SELECAO_EDICAO = 200
+SENHA_MIN_CARACTERES = 8
+
+def encerrar_sessao(pagina: str):
+    """Remove todas as chaves usuario_* da sessão (login, horário de auth...) e vai para `pagina`."""
+    for chave in [k for k in st.session_state if k.startswith("usuario_")]:
+        del st.session_state[chave]
+    st.session_state.usuario_logado = False
+    st.session_state.pagina_atual = pagina
+
+@st.cache_data(show_spinner=False)
+def texto_config_banco() -> str:
+    """Resumo da conexão para a tela de Configurações (a config não muda durante o processo)."""
+    cfg = get_db_config()
+    return f"""
+Host: {cfg.get('host')}
+Database: {cfg.get('database')}
+User: {cfg.get('user')}
+Port: {cfg.get('port')}
+SSL Mode: {cfg.get('sslmode')}
+Timezone: America/Fortaleza
+    """.strip()
+
 def formatar_brl(valor) -> str:
     try:
         v = float(valor)
@@ -120,9 +157,24 @@ def formatar_brl(valor) -> str:
     s = f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     return f"R$ {s}"
 
-def dataframe_to_csv_br(df: pd.DataFrame) -> bytes:
+def dataframe_to_csv_br(df) -> bytes:
     return df.to_csv(index=False, sep=";", decimal=",", encoding="utf-8-sig").encode("utf-8-sig")
 
+def linhas_to_csv_br(linhas) -> bytes:
+    """CSV no mesmo formato de dataframe_to_csv_br, escrito linha a linha (sem montar DataFrame)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+    colunas = None
+    for linha in linhas:
+        if colunas is None:
+            colunas = list(linha)
+            writer.writerow(colunas)
+        writer.writerow([
+            str(v).replace(".", ",") if isinstance(v, (float, Decimal)) else v
+            for v in linha.values()
+        ])
+    return buf.getvalue().encode("utf-8-sig")
+
 
 # =============================
 # KANBAN (Dashboard)
@@ -254,13 +306,19 @@ def _kb_card_block(d: dict):
 def _kb_open_demanda(codigo: str):
     st.session_state.kb_open_codigo = codigo
 
-def render_kanban_board(demandas: list, mostrar_campos_admin_no_comprovante: bool = True):
-    _kb_css()
+def _kb_fechar_demanda():
+    st.session_state.kb_open_codigo = None
 
-    if "kb_open_codigo" not in st.session_state:
-        st.session_state.kb_open_codigo = None
+def _kb_trocar_status(demanda_id: int, codigo: str, chave: str):
+    # Callback do selectbox: roda antes do rerun, então o quadro já volta atualizado
+    novo_status = st.session_state[chave]
+    if atualizar_demanda(demanda_id, {"status": novo_status}):
+        st.toast(f"{codigo} -> {novo_status}", icon="✅")
+    else:
+        st.toast("Falha ao atualizar status.", icon="⚠️")
 
-    status_lista = ["Pendente", "Em andamento", "Concluída", "Cancelada"]
+def render_kanban_board(demandas: list, mostrar_campos_admin_no_comprovante: bool = True):
+    _kb_css()
 
     fazer, fazendo, feito = [], [], []
     for d in (demandas or []):
@@ -284,9 +342,7 @@ def render_kanban_board(demandas: list, mostrar_campos_admin_no_comprovante: boo
 
             c1, c2 = st.columns(2)
             with c1:
-                if st.button("Fechar", use_container_width=True, key="kb_close"):
-                    st.session_state.kb_open_codigo = None
-                    st.rerun()
+                st.button("Fechar", use_container_width=True, key="kb_close", on_click=_kb_fechar_demanda)
             with c2:
                 if st.button("Atualizar", use_container_width=True, key="kb_refresh"):
                     st.rerun()
@@ -311,25 +367,22 @@ def render_kanban_board(demandas: list, mostrar_campos_admin_no_comprovante: boo
                     # Ações: abrir comprovante + trocar status
                     a1, a2 = st.columns([1, 1])
                     with a1:
-                        if st.button("Abrir", key=f"kb_open_{demanda_id}_{codigo}", use_container_width=True):
-                            _kb_open_demanda(codigo)
-                            st.rerun()
+                        st.button(
+                            "Abrir", key=f"kb_open_{demanda_id}_{codigo}", use_container_width=True,
+                            on_click=_kb_open_demanda, args=(codigo,)
+                        )
 
                     with a2:
-                        novo_status = st.selectbox(
+                        chave_status = f"kb_status_{demanda_id}"
+                        st.selectbox(
                             "Status",
-                            status_lista,
-                            index=status_lista.index(status_atual) if status_atual in status_lista else 0,
-                            key=f"kb_status_{demanda_id}",
-                            label_visibility="collapsed"
+                            STATUS_DEMANDA,
+                            index=STATUS_INDEX.get(status_atual, 0),
+                            key=chave_status,
+                            label_visibility="collapsed",
+                            on_change=_kb_trocar_status if demanda_id is not None else None,
+                            args=(demanda_id, codigo, chave_status),
                         )
-                        if demanda_id is not None and novo_status != status_atual:
-                            ok = atualizar_demanda(demanda_id, {"status": novo_status})
-                            if ok:
-                                st.toast(f"{codigo} -> {novo_status}", icon="✅")
-                                st.rerun()
-                            else:
-                                st.toast("Falha ao atualizar status.", icon="⚠️")
 
         st.markdown("</div>", unsafe_allow_html=True)
 
@@ -345,7 +398,7 @@ def render_kanban_board(demandas: list, mostrar_campos_admin_no_comprovante: boo
 # =============================
 # Comprovante e listagens
 # =============================
-def render_comprovante_demanda(d: dict, mostrar_campos_admin: bool = False):
+def render_comprovante_demanda(d: dict, mostrar_campos_admin: bool = False, historico: list = None):
     cor_status = CORES_STATUS.get(d.get("status", "Pendente"), "#FF6B6B")
     cor_prioridade = CORES_PRIORIDADE.get(d.get("prioridade", "Média"), "#FFD166")
 
@@ -470,7 +523,8 @@ def render_comprovante_demanda(d: dict, mostrar_campos_admin: bool = False):
 
     st.markdown("---")
     st.markdown("### 📅 Histórico da Demanda")
-    hist = carregar_historico_demanda(int(d["id"]))
+    # Listas de resultados já trazem o histórico da página inteira numa só consulta
+    hist = historico if historico is not None else carregar_historico_demanda(int(d["id"]))
 
     if not hist:
         st.info("📭 Sem histórico registrado ainda.")
@@ -526,46 +580,64 @@ def render_comprovante_demanda(d: dict, mostrar_campos_admin: bool = False):
     st.markdown("---")
 
 
-def render_resultados_com_detalhes(demandas: list, titulo: str = "Resultados", mostrar_campos_admin: bool = False):
+COLUNAS_RESULTADOS = {
+    "codigo": "Código",
+    "solicitante": "Solicitante",
+    "departamento": "Departamento",
+    "item": "Item",
+    "quantidade": "Qtd",
+    "prioridade": "Prioridade",
+    "status": "Status",
+    "data_criacao_formatada": "Data Criação",
+}
+
+def render_resultados_com_detalhes(demandas: list, titulo: str = "Resultados", mostrar_campos_admin: bool = False,
+                                   totais: dict = None):
+    import pandas as pd
+
     st.subheader(titulo)
 
     if not demandas:
         st.info("📭 Nenhuma demanda encontrada.")
         return
 
-    total_itens = sum(d.get("quantidade", 0) for d in demandas)
-    total_urgentes = sum(1 for d in demandas if d.get("urgencia"))
+    # Com paginação, os totais vêm do banco (obter_estatisticas) e não só da página atual
+    if totais:
+        total_demandas = totais.get("total", 0)
+        total_itens = totais.get("total_itens", 0)
+        total_urgentes = totais.get("urgentes", 0)
+    else:
+        total_demandas = len(demandas)
+        total_itens = sum(d.get("quantidade", 0) for d in demandas)
+        total_urgentes = sum(1 for d in demandas if d.get("urgencia"))
 
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total de Demandas", len(demandas))
+    col1.metric("Total de Demandas", total_demandas)
     col2.metric("Total de Itens", total_itens)
     col3.metric("Demandas Urgentes", total_urgentes)
 
-    df = pd.DataFrame(demandas)
-    df_display = df[[
-        "codigo", "solicitante", "departamento", "item", "quantidade", "prioridade", "status", "data_criacao_formatada"
-    ]].rename(columns={
-        "codigo": "Código",
-        "solicitante": "Solicitante",
-        "departamento": "Departamento",
-        "item": "Item",
-        "quantidade": "Qtd",
-        "prioridade": "Prioridade",
-        "status": "Status",
-        "data_criacao_formatada": "Data Criação"
-    })
+    # Monta o DataFrame já com as colunas finais (sem cópia + rename intermediários)
+    df_display = pd.DataFrame(
+        [[d.get(c) for c in COLUNAS_RESULTADOS] for d in demandas],
+        columns=list(COLUNAS_RESULTADOS.values())
+    )
 
     st.dataframe(df_display, hide_index=True, use_container_width=True)
 
+    historicos = carregar_historicos_demandas([d["id"] for d in demandas])
     for d in demandas:
         with st.expander(f"📋 Detalhes {d.get('codigo', 'SEM-COD')} - {d.get('solicitante','')}", expanded=False):
-            render_comprovante_demanda(d, mostrar_campos_admin=mostrar_campos_admin)
+            render_comprovante_demanda(
+                d, mostrar_campos_admin=mostrar_campos_admin, historico=historicos.get(d["id"], [])
+            )
 
 
 # =============================
 # Relatório mensal
 # =============================
 def render_relatorio_mensal_automatico():
+    import pandas as pd
+
     st.header("📅 Relatório Mensal Automático")
     st.caption("Filtro aplicado: Mês atual")
 
@@ -613,8 +685,7 @@ def pagina_gerenciar_usuarios():
     st.header("👥 Gerenciar Usuários")
     st.caption("Criação, edição e desativação de usuários.")
 
-    usuarios = listar_usuarios()
-    df_usuarios = pd.DataFrame(usuarios)
+    df_usuarios = listar_usuarios()
 
     if not df_usuarios.empty:
         st.dataframe(df_usuarios, hide_index=True, use_container_width=True)
@@ -628,13 +699,15 @@ def pagina_gerenciar_usuarios():
         username = col1.text_input("Username*")
         senha = col2.text_input("Senha*", type="password")
         departamento = col1.text_input("Departamento")
-        nivel_acesso = col2.selectbox("Nível de Acesso", ["usuario", "supervisor", "administrador"])
+        nivel_acesso = col2.selectbox("Nível de Acesso", NIVEIS_ACESSO)
         is_admin = st.checkbox("É Administrador?", value=(nivel_acesso == "administrador"))
 
         submitted = st.form_submit_button("✅ Criar Usuário", type="primary")
 
         if submitted:
-            if nome and email and username and senha:
+            if nome and email and username and senha and len(senha) < SENHA_MIN_CARACTERES:
+                st.error(f"A senha precisa ter pelo menos {SENHA_MIN_CARACTERES} caracteres.")
+            elif nome and email and username and senha:
                 dados = {
                     "nome": nome,
                     "email": email,
@@ -656,12 +729,17 @@ def pagina_gerenciar_usuarios():
     st.markdown("---")
     st.subheader("✏️ Editar/Desativar Usuário")
     if not df_usuarios.empty:
-        opcoes = [f"{u['id']} - {u['nome']} ({u['username']})" for u in usuarios]
-        escolha = st.selectbox("Selecione o usuário para editar", opcoes, index=None)
+        usuarios_por_id = {u.id: u._asdict() for u in df_usuarios.itertuples(index=False)}
+        escolha = st.selectbox(
+            "Selecione o usuário para editar",
+            list(usuarios_por_id),
+            index=None,
+            format_func=lambda i: f"{i} - {usuarios_por_id[i]['nome']} ({usuarios_por_id[i]['username']})"
+        )
 
-        if escolha:
-            user_id = int(escolha.split(" - ")[0])
-            usuario_selecionado = next(u for u in usuarios if u["id"] == user_id)
+        if escolha is not None:
+            user_id = int(escolha)
+            usuario_selecionado = usuarios_por_id[escolha]
 
             with st.form(f"form_editar_usuario_{user_id}"):
                 col_e1, col_e2 = st.columns(2)
@@ -669,20 +747,22 @@ def pagina_gerenciar_usuarios():
                 email_e = col_e2.text_input("Email", value=usuario_selecionado["email"])
                 col_e1.text_input("Username", value=usuario_selecionado["username"], disabled=True)
                 senha_e = col_e2.text_input("Nova Senha (deixe em branco para manter)", type="password")
-                departamento_e = col_e1.text_input("Departamento", value=usuario_selecionado.get("departamento", ""))
+                departamento_e = col_e1.text_input("Departamento", value=usuario_selecionado.get("departamento") or "")
                 nivel_acesso_e = col_e2.selectbox(
                     "Nível de Acesso",
-                    ["usuario", "supervisor", "administrador"],
-                    index=["usuario", "supervisor", "administrador"].index(usuario_selecionado["nivel_acesso"])
+                    NIVEIS_ACESSO,
+                    index=NIVEL_INDEX.get(usuario_selecionado["nivel_acesso"], 0)
                 )
-                is_admin_e = st.checkbox("É Administrador?", value=usuario_selecionado["is_admin"])
-                ativo_e = st.checkbox("Usuário Ativo", value=usuario_selecionado["ativo"])
+                is_admin_e = st.checkbox("É Administrador?", value=bool(usuario_selecionado["is_admin"]))
+                ativo_e = st.checkbox("Usuário Ativo", value=bool(usuario_selecionado["ativo"]))
 
                 col_b1, col_b2 = st.columns(2)
                 salvar_e = col_b1.form_submit_button("💾 Salvar Alterações", type="primary")
                 desativar_e = col_b2.form_submit_button("❌ Desativar Usuário")
 
-                if salvar_e:
+                if salvar_e and senha_e and len(senha_e) < SENHA_MIN_CARACTERES:
+                    st.error(f"A senha precisa ter pelo menos {SENHA_MIN_CARACTERES} caracteres.")
+                elif salvar_e:
                     dados_e = {
                         "nome": nome_e,
                         "email": email_e,
@@ -756,117 +836,121 @@ def pagina_inicial():
     else:
         st.info("Aguardando inicialização do banco de dados...")
 
-def pagina_solicitacao():
-    st.title("📝 Solicitação de Demandas")
-    st.markdown("---")
+def render_confirmacao_solicitacao():
+    """Confirmação + comprovante da última solicitação enviada."""
+    st.success(f"""
+    ✅ **Solicitação enviada com sucesso!**
 
-    if "solicitacao_enviada" not in st.session_state:
-        st.session_state.solicitacao_enviada = False
-    if "ultima_demanda_codigo" not in st.session_state:
-        st.session_state.ultima_demanda_codigo = None
+    **Código da demanda:** `{st.session_state.ultima_demanda_codigo}`
 
-    if st.session_state.solicitacao_enviada:
-        st.success(f"""
-        ✅ **Solicitação enviada com sucesso!**
+    Guarde este código para consultar o status posteriormente.
+    """)
 
-        **Código da demanda:** `{st.session_state.ultima_demanda_codigo}`
+    st.balloons()
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("📝 Enviar nova solicitação", use_container_width=True):
+            st.session_state.solicitacao_enviada = False
+            st.session_state.ultima_demanda_codigo = None
+            st.rerun()
+    with col2:
+        if st.button("🏠 Voltar ao início", use_container_width=True):
+            st.session_state.pagina_atual = "inicio"
+            st.session_state.solicitacao_enviada = False
+            st.session_state.ultima_demanda_codigo = None
+            st.rerun()
 
-        Guarde este código para consultar o status posteriormente.
-        """)
+    st.markdown("---")
+    st.subheader("📋 Comprovante da Demanda Enviada")
+    filtros = {"codigo": st.session_state.ultima_demanda_codigo}
+    resultado = carregar_demandas(filtros)
+    if resultado:
+        render_comprovante_demanda(resultado[0], mostrar_campos_admin=False)
 
-        st.balloons()
 
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("📝 Enviar nova solicitação", use_container_width=True):
-                st.session_state.solicitacao_enviada = False
-                st.session_state.ultima_demanda_codigo = None
-                st.rerun()
-        with col2:
-            if st.button("🏠 Voltar ao início", use_container_width=True):
-                st.session_state.pagina_atual = "inicio"
-                st.session_state.solicitacao_enviada = False
-                st.session_state.ultima_demanda_codigo = None
-                st.rerun()
+def pagina_solicitacao():
+    st.title("📝 Solicitação de Demandas")
+    st.markdown("---")
 
-        st.markdown("---")
-        st.subheader("📋 Comprovante da Demanda Enviada")
-        filtros = {"codigo": st.session_state.ultima_demanda_codigo}
-        resultado = carregar_demandas(filtros)
-        if resultado:
-            render_comprovante_demanda(resultado[0], mostrar_campos_admin=False)
+    if st.session_state.solicitacao_enviada:
+        render_confirmacao_solicitacao()
         return
 
-    st.markdown("### 📝 Nova Solicitação")
-    with st.form("form_nova_demanda", clear_on_submit=True):
-        col1, col2 = st.columns(2)
+    # Após o envio, o formulário é trocado pela confirmação no mesmo run (sem st.rerun)
+    area_form = st.empty()
+    with area_form.container():
+        st.markdown("### 📝 Nova Solicitação")
+        with st.form("form_nova_demanda", clear_on_submit=True):
+            col1, col2 = st.columns(2)
 
-        with col1:
-            solicitante = st.text_input("👤 Nome do Solicitante*", placeholder="Seu nome completo")
-            departamento = st.selectbox(
-                "🏢 Setor*",
-                ["Administrativo", "Açudes", "EB", "Gestão", "Operação", "Outro"],
-                index=None,
-                placeholder="Escolha um setor"
-            )
-            local = st.selectbox(
-                "📍 Local*",
-                ["Banabuiú", "Capitão Mor", "Cipoada", "Fogareiro", "Gerência", "Outro", "Patu", "Pirabibu",
-                 "Poço do Barro", "Quixeramobim", "São Jose I", "São Jose II", "Serafim Dias", "Trapiá II",
-                 "Umari", "Vieirão"],
-                index=None,
-                placeholder="Escolha um local"
-            )
-            categoria = st.selectbox(
-                "📂 Categoria*",
-                ["Alimentos", "Água potável", "Combustível", "Equipamentos", "Ferramentas", "Lubrificantes",
-                 "Materiais", "Outro"],
-                index=None,
-                placeholder="Escolha uma categoria"
-            )
+            with col1:
+                solicitante = st.text_input("👤 Nome do Solicitante*", placeholder="Seu nome completo")
+                departamento = st.selectbox(
+                    "🏢 Setor*",
+                    DEPARTAMENTOS,
+                    index=None,
+                    placeholder="Escolha um setor"
+                )
+                local = st.selectbox(
+                    "📍 Local*",
+                    LOCAIS,
+                    index=None,
+                    placeholder="Escolha um local"
+                )
+                categoria = st.selectbox(
+                    "📂 Categoria*",
+                    CATEGORIAS,
+                    index=None,
+                    placeholder="Escolha uma categoria"
+                )
 
-        with col2:
-            item = st.text_input("📝 Descrição da Demanda*", placeholder="Descreva a solicitação")
-            quantidade = st.number_input("🔢 Quantidade*", min_value=1, value=1, step=1)
-            unidade = st.selectbox(
-                "📏 Unidade*",
-                ["Kg", "Litros", "Garrafão", "Galão", "Unid.", "Metros", "m²", "m³", "Outro"],
-                index=None,
-                placeholder="Escolha a unidade"
-            )
+            with col2:
+                item = st.text_input("📝 Descrição da Demanda*", placeholder="Descreva a solicitação")
+                quantidade = st.number_input("🔢 Quantidade*", min_value=1, value=1, step=1)
+                unidade = st.selectbox(
+                    "📏 Unidade*",
+                    UNIDADES,
+                    index=None,
+                    placeholder="Escolha a unidade"
+                )
 
-        col3, col4 = st.columns(2)
-        with col3:
-            prioridade = st.selectbox("🚨 Prioridade", ["Baixa", "Média", "Alta", "Urgente"], index=1)
-            urgencia = st.checkbox("🚨 Marcar como URGENTE?")
-        with col4:
-            observacoes = st.text_area("💬 Observações Adicionais", height=100)
+            col3, col4 = st.columns(2)
+            with col3:
+                prioridade = st.selectbox("🚨 Prioridade", PRIORIDADES, index=1)
+                urgencia = st.checkbox("🚨 Marcar como URGENTE?")
+            with col4:
+                observacoes = st.text_area("💬 Observações Adicionais", height=100)
 
-        submitted = st.form_submit_button("✅ Enviar Solicitação", type="primary", use_container_width=True)
+            submitted = st.form_submit_button("✅ Enviar Solicitação", type="primary", use_container_width=True)
 
-        if submitted:
-            if not (solicitante and item and departamento and local and unidade and categoria):
-                st.error("⚠️ Preencha todos os campos obrigatórios (*)")
-            else:
-                nova_demanda = {
-                    "item": item,
-                    "quantidade": int(quantidade),
-                    "solicitante": solicitante.strip(),
-                    "departamento": departamento,
-                    "local": local,
-                    "prioridade": prioridade,
-                    "observacoes": observacoes,
-                    "categoria": categoria,
-                    "unidade": unidade,
-                    "urgencia": bool(urgencia),
-                }
-                res = adicionar_demanda(nova_demanda)
-                if res and res.get("codigo"):
-                    st.session_state.solicitacao_enviada = True
-                    st.session_state.ultima_demanda_codigo = res["codigo"]
-                    st.rerun()
+            if submitted:
+                if not (solicitante and item and departamento and local and unidade and categoria):
+                    st.error("⚠️ Preencha todos os campos obrigatórios (*)")
                 else:
-                    st.error("❌ Erro ao salvar a solicitação. Tente novamente.")
+                    nova_demanda = {
+                        "item": item,
+                        "quantidade": int(quantidade),
+                        "solicitante": solicitante.strip(),
+                        "departamento": departamento,
+                        "local": local,
+                        "prioridade": prioridade,
+                        "observacoes": observacoes,
+                        "categoria": categoria,
+                        "unidade": unidade,
+                        "urgencia": bool(urgencia),
+                    }
+                    res = adicionar_demanda(nova_demanda)
+                    if res and res.get("codigo"):
+                        st.session_state.solicitacao_enviada = True
+                        st.session_state.ultima_demanda_codigo = res["codigo"]
+                    else:
+                        st.error("❌ Erro ao salvar a solicitação. Tente novamente.")
+
+    if st.session_state.solicitacao_enviada:
+        area_form.empty()
+        render_confirmacao_solicitacao()
+        return
 
     st.markdown("---")
     st.markdown("### 🔎 Consultar Demandas")
@@ -913,6 +997,7 @@ def pagina_login_admin():
                 usuario = autenticar_usuario(username, senha)
                 if usuario:
                     st.session_state.usuario_logado = usuario
+                    st.session_state.usuario_auth_ts = time.time()
                     st.session_state.pagina_atual = "admin"
                     st.rerun()
                 else:
@@ -927,6 +1012,8 @@ def pagina_login_admin():
 # Admin
 # =============================
 def pagina_admin():
+    import pandas as pd
+
     usuario = st.session_state.usuario_logado
     usuario_nome = usuario.get("nome", "Admin")
     usuario_nivel = usuario.get("nivel_acesso", "usuario")
@@ -946,8 +1033,7 @@ def pagina_admin():
     """, unsafe_allow_html=True)
 
     if st.sidebar.button("🚪 Sair do Sistema", type="secondary", use_container_width=True):
-        st.session_state.usuario_logado = False
-        st.session_state.pagina_atual = "inicio"
+        encerrar_sessao("inicio")
         st.rerun()
 
     menu_opcoes = ["📋 Dashboard", "🔎 Consultar Demandas", "✏️ Editar Demanda", "📅 Relatório Mensal", "📊 Estatísticas"]
@@ -960,15 +1046,16 @@ def pagina_admin():
     st.sidebar.markdown("---")
     st.sidebar.subheader("Filtros de Pesquisa")
 
+    hoje = agora_fortaleza().date()
     with st.sidebar.expander("Filtros de Data", expanded=False):
         data_inicio = st.date_input(
             "Data Início",
-            value=agora_fortaleza().date() - timedelta(days=30),
+            value=hoje - timedelta(days=30),
             format="DD/MM/YYYY"
         )
         data_fim = st.date_input(
             "Data Fim",
-            value=agora_fortaleza().date(),
+            value=hoje,
             format="DD/MM/YYYY"
         )
 
@@ -1012,14 +1099,17 @@ def pagina_admin():
         st.markdown("---")
         if est.get("por_status"):
             st.subheader("📈 Distribuição por Status")
-            df_status = pd.DataFrame(list(est["por_status"].items()), columns=["Status", "Quantidade"])
-            st.bar_chart(df_status.set_index("Status")["Quantidade"], use_container_width=True)
+            serie_status = pd.Series(est["por_status"], name="Quantidade").rename_axis("Status")
+            st.bar_chart(serie_status, use_container_width=True)
 
         st.markdown("---")
         st.subheader("🚨 Demandas Urgentes e de Alta Prioridade")
-        filtros_urgentes = filtros.copy()
-        filtros_urgentes["prioridade"] = ["Urgente", "Alta"]
-        demandas_urgentes = carregar_demandas(filtros_urgentes)
+        prioridades_urgentes = ("Urgente", "Alta")
+        if set(prioridades_urgentes) <= set(filtros["prioridade"] or PRIORIDADES):
+            # O Kanban já trouxe essas demandas: filtra em memória, sem nova consulta
+            demandas_urgentes = [d for d in demandas_kanban if d.get("prioridade") in prioridades_urgentes]
+        else:
+            demandas_urgentes = carregar_demandas({**filtros, "prioridade": list(prioridades_urgentes)})
         render_resultados_com_detalhes(demandas_urgentes, "Demandas Urgentes/Alta", mostrar_campos_admin=True)
 
     # =============================
@@ -1028,13 +1118,33 @@ def pagina_admin():
     elif menu_sel == "🔎 Consultar Demandas":
         st.header("🔎 Consultar Demandas (Admin)")
         st.caption("Filtros aplicados na barra lateral.")
-        demandas = carregar_demandas(filtros)
-        render_resultados_com_detalhes(demandas, "Demandas Encontradas", mostrar_campos_admin=True)
 
-        if demandas:
+        # Formulário: a busca só consulta o banco ao enviar, não a cada tecla
+        with st.form("busca_form"):
+            busca = st.text_input("Buscar por item ou solicitante")
+            st.form_submit_button("🔍 Buscar")
+
+        filtros_consulta = dict(filtros)
+        if busca.strip():
+            filtros_consulta["busca"] = busca.strip()
+
+        totais = obter_estatisticas(filtros_consulta).get("totais", {})
+        total_paginas = max(1, -(-int(totais.get("total", 0)) // TAMANHO_PAGINA_ADMIN))
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1)
+        st.caption(f"Página {pagina} de {total_paginas}")
+
+        demandas = carregar_demandas({
+            **filtros_consulta,
+            "limite": TAMANHO_PAGINA_ADMIN,
+            "offset": (pagina - 1) * TAMANHO_PAGINA_ADMIN,
+        })
+        render_resultados_com_detalhes(demandas, "Demandas Encontradas", mostrar_campos_admin=True, totais=totais)
+
+        # A exportação percorre todas as páginas com cursor no servidor, só quando pedida
+        if demandas and st.button("📄 Gerar CSV", use_container_width=True):
             st.download_button(
                 label="📥 Baixar Dados (CSV)",
-                data=dataframe_to_csv_br(pd.DataFrame(demandas)),
+                data=linhas_to_csv_br(iterar_demandas(filtros_consulta)),
                 file_name="demandas_filtradas.csv",
                 mime="text/csv",
                 use_container_width=True
@@ -1044,24 +1154,34 @@ def pagina_admin():
     # Editar demanda
     # =============================
     elif menu_sel == "✏️ Editar Demanda":
-        if usuario_nivel not in ["supervisor", "administrador"]:
+        if usuario_nivel not in ("supervisor", "administrador"):
             st.error("⛔ Apenas supervisores e administradores podem editar demandas.")
             return
 
         st.header("✏️ Editar Demanda")
         st.caption("Editável somente: Status, Almoxarifado, Valor e Observações.")
 
-        todas = carregar_demandas(filtros)
-        if not todas:
+        resumo = listar_demandas_resumo(filtros, LIMITE_SELECAO_EDICAO)
+        if not resumo:
             st.info("📭 Nenhuma demanda cadastrada nesse período/filtro.")
             return
+        if len(resumo) == LIMITE_SELECAO_EDICAO:
+            st.caption(f"Mostrando as {LIMITE_SELECAO_EDICAO} demandas mais recentes. Use os filtros para refinar.")
+
+        resumo_por_id = {d["id"]: d for d in resumo}
+        escolha = st.selectbox(
+            "Selecione uma demanda para editar",
+            list(resumo_por_id),
+            index=0,
+            format_func=lambda i: (
+                f"{resumo_por_id[i].get('codigo') or 'SEM-COD'} | {resumo_por_id[i].get('solicitante','')} | "
+                f"{resumo_por_id[i].get('item') or ''}..."
+            )
+        )
 
-        opcoes = [f"{d.get('codigo','SEM-COD')} | {d.get('solicitante','')} | {(d.get('item','')[:50])}..." for d in todas]
-        escolha = st.selectbox("Selecione uma demanda para editar", opcoes, index=0)
-
-        if escolha:
-            codigo_selecionado = escolha.split("|")[0].strip()
-            demanda = next((d for d in todas if d.get("codigo") == codigo_selecionado), None)
+        if escolha is not None:
+            # Só a demanda escolhida é carregada por completo
+            demanda = obter_demanda(escolha)
 
             if not demanda:
                 st.error("Demanda não encontrada.")
@@ -1071,9 +1191,7 @@ def pagina_admin():
             st.markdown(f"**Editando demanda:** `{demanda.get('codigo', '')}`")
 
             with st.form(f"form_editar_{demanda_id}"):
-                status_lista = ["Pendente", "Em andamento", "Concluída", "Cancelada"]
-                st_index = status_lista.index(demanda["status"]) if demanda.get("status") in status_lista else 0
-                status_edit = st.selectbox("📊 Status", status_lista, index=st_index)
+                status_edit = st.selectbox("📊 Status", STATUS_DEMANDA, index=STATUS_INDEX.get(demanda.get("status"), 0))
 
                 almoxarifado_edit = st.selectbox(
                     "📦 Almoxarifado", ["Não", "Sim"],
@@ -1118,11 +1236,7 @@ def pagina_admin():
 
             st.markdown("---")
             st.subheader("📋 Prévia do Comprovante (Admin)")
-            atualizado = carregar_demandas({"codigo": demanda.get("codigo")})
-            if atualizado:
-                render_comprovante_demanda(atualizado[0], mostrar_campos_admin=True)
-            else:
-                render_comprovante_demanda(demanda, mostrar_campos_admin=True)
+            render_comprovante_demanda(demanda, mostrar_campos_admin=True)
 
     elif menu_sel == "📅 Relatório Mensal":
         render_relatorio_mensal_automatico()
@@ -1144,48 +1258,35 @@ def pagina_admin():
         with col1:
             if est.get("por_status"):
                 st.subheader("📈 Distribuição por Status")
-                df_status = pd.DataFrame(list(est["por_status"].items()), columns=["Status", "Quantidade"])
-                st.bar_chart(df_status.set_index("Status")["Quantidade"], use_container_width=True)
-                st.dataframe(df_status, hide_index=True, use_container_width=True)
+                serie_status = pd.Series(est["por_status"], name="Quantidade").rename_axis("Status")
+                st.bar_chart(serie_status, use_container_width=True)
+                st.dataframe(serie_status.reset_index(), hide_index=True, use_container_width=True)
 
         with col2:
             if est.get("por_prioridade"):
                 st.subheader("🚨 Distribuição por Prioridade")
-                df_prioridade = pd.DataFrame(list(est["por_prioridade"].items()), columns=["Prioridade", "Quantidade"])
-                ordem_prioridade = ["Urgente", "Alta", "Média", "Baixa"]
-                df_prioridade["Ordem"] = df_prioridade["Prioridade"].apply(
-                    lambda x: ordem_prioridade.index(x) if x in ordem_prioridade else 99
-                )
-                df_prioridade = df_prioridade.sort_values("Ordem")
-                st.bar_chart(df_prioridade.set_index("Prioridade")["Quantidade"], use_container_width=True)
-                st.dataframe(df_prioridade[["Prioridade", "Quantidade"]], hide_index=True, use_container_width=True)
+                # obter_estatisticas já devolve as prioridades em ordem (Urgente → Baixa)
+                serie_prioridade = pd.Series(est["por_prioridade"], name="Quantidade").rename_axis("Prioridade")
+                st.bar_chart(serie_prioridade, use_container_width=True)
+                st.dataframe(serie_prioridade.reset_index(), hide_index=True, use_container_width=True)
 
         if est.get("por_departamento"):
             st.markdown("---")
             st.subheader("🏢 Demandas por Departamento")
-            df_depto = pd.DataFrame(list(est["por_departamento"].items()), columns=["Departamento", "Quantidade"])
-            df_depto = df_depto.sort_values("Quantidade", ascending=False)
+            # Já ordenado por quantidade (decrescente) no SQL
+            serie_depto = pd.Series(est["por_departamento"], name="Quantidade").rename_axis("Departamento")
 
             col1, col2 = st.columns([2, 1])
             with col1:
-                st.bar_chart(df_depto.set_index("Departamento")["Quantidade"], use_container_width=True)
+                st.bar_chart(serie_depto, use_container_width=True)
             with col2:
-                st.dataframe(df_depto, hide_index=True, use_container_width=True)
+                st.dataframe(serie_depto.reset_index(), hide_index=True, use_container_width=True)
 
     elif menu_sel == "⚙️ Configurações":
         st.header("⚙️ Configurações do Sistema")
 
         st.subheader("🔌 Conexão com Banco de Dados")
-        cfg = get_db_config()
-
-        st.code(f"""
-Host: {cfg.get('host')}
-Database: {cfg.get('database')}
-User: {cfg.get('user')}
-Port: {cfg.get('port')}
-SSL Mode: {cfg.get('sslmode')}
-Timezone: America/Fortaleza
-        """.strip(), language="bash")
+        st.code(texto_config_banco(), language="bash")
 
         if st.button("🔄 Testar Conexão com Banco de Dados", use_container_width=True):
             with st.spinner("Testando conexão..."):
@@ -1239,11 +1340,15 @@ if "init_complete" not in st.session_state:
         st.error(msg)
         st.session_state.demo_mode = True
 
-if "pagina_atual" not in st.session_state:
-    st.session_state.pagina_atual = "inicio"
+for _chave, _padrao in SESSAO_PADRAO.items():
+    st.session_state.setdefault(_chave, _padrao)
 
-if "usuario_logado" not in st.session_state:
-    st.session_state.usuario_logado = False
+# Sessão autenticada fica no session_state (sem reautenticar a cada rerun),
+# mas expira depois de SESSAO_TTL_SEG sem novo login.
+if st.session_state.usuario_logado:
+    auth_ts = st.session_state.get("usuario_auth_ts")
+    if not auth_ts or time.time() - auth_ts > SESSAO_TTL_SEG:
+        encerrar_sessao("login_admin")
 
 # =============================
 # Rotas
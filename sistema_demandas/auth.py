@@ -1,18 +1,46 @@
 # auth.py
 
 import hashlib
+import hmac
+import os
+
+# PBKDF2 da biblioteca padrão (sem dependência nova). ~30 ms por verificação
+# nesta contagem de iterações; suba junto com o hardware.
+PBKDF2_ALGORITMO = "pbkdf2_sha256"
+PBKDF2_ITERACOES = 100_000
+
+
+def _pbkdf2(password: str, salt: bytes, iteracoes: int) -> str:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iteracoes).hex()
+
 
 def hash_password(password: str) -> str:
     """
-    Gera o hash SHA256 da senha.
-    
-    NOTA DE MELHORIA: O SHA256 é rápido e vulnerável a ataques de força bruta.
-    Para produção, considere usar uma biblioteca como `passlib` com algoritmos
-    lentos e modernos como `bcrypt` ou `argon2`.
+    Gera o hash da senha no formato pbkdf2_sha256$iterações$salt$hash.
+    Hashes antigos (SHA256 puro) continuam válidos em verificar_senha.
     """
-    return hashlib.sha256(password.encode()).hexdigest()
+    salt = os.urandom(16)
+    return f"{PBKDF2_ALGORITMO}${PBKDF2_ITERACOES}${salt.hex()}${_pbkdf2(password, salt, PBKDF2_ITERACOES)}"
 
 
 def verificar_senha(senha_digitada: str, senha_hash: str) -> bool:
     """Verifica se a senha digitada corresponde ao hash armazenado."""
-    return hash_password(senha_digitada) == senha_hash
+    if not senha_hash:
+        return False
+    partes = senha_hash.split("$")
+    if len(partes) == 4 and partes[0] == PBKDF2_ALGORITMO:
+        _, iteracoes, salt, esperado = partes
+        calculado = _pbkdf2(senha_digitada, bytes.fromhex(salt), int(iteracoes))
+    else:
+        # Legado: SHA256 sem salt
+        calculado = hashlib.sha256(senha_digitada.encode()).hexdigest()
+        esperado = senha_hash
+    return hmac.compare_digest(calculado, esperado)
+
+
+def precisa_rehash(senha_hash: str) -> bool:
+    """True se o hash é legado (SHA256) ou usa menos iterações que o padrão atual."""
+    partes = (senha_hash or "").split("$")
+    if len(partes) != 4 or partes[0] != PBKDF2_ALGORITMO:
+        return True
+    return int(partes[1]) < PBKDF2_ITERACOES
@@ -1,14 +1,16 @@
 # config.py
 
 import os
-import pytz
+import re
+from functools import cache
+from zoneinfo import ZoneInfo
 from urllib.parse import urlparse
 import streamlit as st
 
 # =============================
 # Fuso horário Fortaleza
 # =============================
-FORTALEZA_TZ = pytz.timezone("America/Fortaleza")
+FORTALEZA_TZ = ZoneInfo("America/Fortaleza")
 
 # =============================
 # Cores para o tema Cogerh/Água
@@ -40,16 +42,41 @@ CORES_PRIORIDADE = {
     "Baixa": TEMA_CORES["success"]
 }
 
+# =============================
+# Opções fixas dos formulários
+# =============================
+STATUS_DEMANDA = ("Pendente", "Em andamento", "Concluída", "Cancelada")
+STATUS_INDEX = {s: i for i, s in enumerate(STATUS_DEMANDA)}
+
+PRIORIDADES = ("Baixa", "Média", "Alta", "Urgente")
+
+NIVEIS_ACESSO = ("usuario", "supervisor", "administrador")
+NIVEL_INDEX = {n: i for i, n in enumerate(NIVEIS_ACESSO)}
+
+DEPARTAMENTOS = ("Administrativo", "Açudes", "EB", "Gestão", "Operação", "Outro")
+LOCAIS = (
+    "Banabuiú", "Capitão Mor", "Cipoada", "Fogareiro", "Gerência", "Outro", "Patu", "Pirabibu",
+    "Poço do Barro", "Quixeramobim", "São Jose I", "São Jose II", "Serafim Dias", "Trapiá II",
+    "Umari", "Vieirão",
+)
+CATEGORIAS = (
+    "Alimentos", "Água potável", "Combustível", "Equipamentos", "Ferramentas", "Lubrificantes",
+    "Materiais", "Outro",
+)
+UNIDADES = ("Kg", "Litros", "Garrafão", "Galão", "Unid.", "Metros", "m²", "m³", "Outro")
+
 # =============================
 # Funções de variáveis de ambiente
 # =============================
+_VALORES_VERDADEIROS = frozenset({"1", "true", "yes", "y", "sim", "on"})
+_SEPARADORES_LISTA = re.compile(r"[,;]")
 
 def _env_bool(name: str, default: bool = False) -> bool:
     """Lê variável de ambiente como booleano."""
     v = os.environ.get(name)
     if v is None:
         return default
-    return str(v).strip().lower() in ("1", "true", "yes", "y", "sim", "on")
+    return str(v).strip().lower() in _VALORES_VERDADEIROS
 
 
 def _env_int(name: str, default: int) -> int:
@@ -63,12 +90,13 @@ def _env_int(name: str, default: int) -> int:
 def _env_list(name: str) -> list:
     """Lê variável de ambiente como lista de strings separadas por vírgula ou ponto e vírgula."""
     raw = os.environ.get(name, "") or ""
-    itens = [x.strip() for x in raw.replace(";", ",").split(",")]
-    return [x for x in itens if x]
+    return [x for x in (s.strip() for s in _SEPARADORES_LISTA.split(raw)) if x]
 
 # =============================
 # Configuração de Banco de Dados
 # =============================
+# As funções get_*_config leem o ambiente uma vez por processo (functools.cache);
+# use get_db_config.cache_clear() etc. se o ambiente mudar em tempo de execução.
 
 DATABASE_URL = (
     os.environ.get("DATABASE_PUBLIC_URL")
@@ -83,8 +111,25 @@ def _safe_st_secrets_get(key: str, default=None):
     except Exception:
         return default
 
+@cache
 def get_db_config():
-    """Retorna as configurações de conexão com o PostgreSQL."""
+    """
+    Retorna as configurações de conexão com o PostgreSQL.
+
+    Com PGBOUNCER_HOST definido, a conexão passa pelo PgBouncer (modo transaction):
+    host/porta são trocados e "pgbouncer" fica True, o que desliga PREPARE e
+    parâmetros de sessão (TimeZone) no db_connector.
+    """
+    config = _get_db_config_base()
+    pgbouncer_host = os.environ.get("PGBOUNCER_HOST", "").strip()
+    config["pgbouncer"] = bool(pgbouncer_host)
+    if pgbouncer_host:
+        config["host"] = pgbouncer_host
+        config["port"] = _env_int("PGBOUNCER_PORT", 6432)
+    return config
+
+
+def _get_db_config_base() -> dict:
     if DATABASE_URL:
         url = urlparse(DATABASE_URL)
         return {
@@ -109,6 +154,7 @@ def get_db_config():
 # Configuração de Email
 # =============================
 
+@cache
 def get_email_config() -> dict:
     """Retorna as configurações de envio de e-mail via SMTP."""
     smtp_password = (os.environ.get("SMTP_PASSWORD") or os.environ.get("SMTP_PASS") or "").strip()
@@ -128,6 +174,7 @@ def get_email_config() -> dict:
     }
 
 
+@cache
 def get_brevo_config() -> dict:
     """Retorna as configurações de envio de e-mail via Brevo API."""
     return {
@@ -1,59 +1,103 @@
 # data_access.py
 
-import json
-from datetime import datetime, date, timedelta
-from decimal import Decimal
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
 import streamlit as st
-import pandas as pd
+from psycopg2.errors import UndefinedTable
 
-from .db_connector import get_db_connection
-from .auth import hash_password, verificar_senha
-from .timezone_utils import agora_fortaleza, formatar_data_hora_fortaleza
-from .email_service import enviar_email_nova_demanda
+from .db_connector import get_db_connection, executar_preparado
+from .auth import hash_password, verificar_senha, precisa_rehash
+from .config import FORTALEZA_TZ, _env_int
+from .timezone_utils import agora_fortaleza
+from .email_service import agendar_email_nova_demanda
 
-# =============================
-# JSON seguro
-# =============================
-def json_safe(obj):
-    """Converte objetos não serializáveis (Decimal, datetime) para tipos JSON-safe."""
-    if isinstance(obj, dict):
-        return {k: json_safe(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [json_safe(v) for v in obj]
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    if isinstance(obj, Decimal):
-        return float(obj)
-    return obj
-
-
-def dumps_safe(payload) -> str:
-    """Serializa um objeto Python para string JSON de forma segura."""
-    return json.dumps(json_safe(payload), ensure_ascii=False, default=str)
+_log = logging.getLogger(__name__)
 
 # =============================
 # Auth usuários (DB Access)
 # =============================
+SQL_AUTENTICAR_USUARIO = """
+    SELECT id, nome, email, username, senha_hash,
+           nivel_acesso, is_admin, departamento, ativo
+    FROM usuarios
+    WHERE username = $1 AND ativo = TRUE
+"""
+
+SQL_REGISTRAR_LOGINS = "UPDATE usuarios SET ultimo_login = CURRENT_TIMESTAMP WHERE id = ANY(%s)"
+
+SQL_ATUALIZAR_HASH_SENHA = "UPDATE usuarios SET senha_hash = $1 WHERE id = $2"
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _buscar_usuario_login(username):
+    """Busca o usuário ativo pelo username (cache curto para tentativas seguidas de login)."""
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cur:
+            executar_preparado(cur, "autenticar_usuario", SQL_AUTENTICAR_USUARIO, (username,))
+            rows = _linhas_como_dicts(cur)
+            return rows[0] if rows else None
+
+
+# ultimo_login é gravado fora do caminho do login: os ids entram numa fila e uma
+# thread em segundo plano grava em lote (tolera alguns segundos de atraso).
+_fila_logins = queue.Queue()
+
+
+def _gravar_lote_logins() -> None:
+    """Aguarda um id na fila, junta os demais pendentes e grava ultimo_login num único UPDATE."""
+    ids = {_fila_logins.get()}
+    while True:
+        try:
+            ids.add(_fila_logins.get_nowait())
+        except queue.Empty:
+            break
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SQL_REGISTRAR_LOGINS, (sorted(ids),))
+            conn.commit()
+
+
+def _gravar_logins_pendentes():
+    """Loop da thread: grava os lotes de ultimo_login até o fim do processo."""
+    while True:
+        try:
+            _gravar_lote_logins()
+        except Exception:
+            # Perder um ultimo_login não deve derrubar a thread
+            _log.exception("Falha ao gravar ultimo_login")
+
+
+@st.cache_resource(show_spinner=False)
+def _iniciar_gravador_logins() -> threading.Thread:
+    """Sobe (uma única vez por processo) a thread que grava ultimo_login."""
+    t = threading.Thread(target=_gravar_logins_pendentes, name="gravador_logins", daemon=True)
+    t.start()
+    return t
+
+
 def autenticar_usuario(username, senha):
     """Autentica o usuário e atualiza o último login."""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
-                cur.execute("""
-                    SELECT id, nome, email, username, senha_hash,
-                           nivel_acesso, is_admin, departamento, ativo
-                    FROM usuarios
-                    WHERE username = %s AND ativo = TRUE
-                """, (username,))
-                u = cur.fetchone()
-                if u and verificar_senha(senha, u["senha_hash"]):
-                    cur.execute("UPDATE usuarios SET ultimo_login = CURRENT_TIMESTAMP WHERE id = %s", (u["id"],))
-                    conn.commit()
-                    return u
-                return None
+        # A senha é conferida a cada tentativa; só a leitura do usuário vem do cache
+        u = _buscar_usuario_login(username)
+        if u and verificar_senha(senha, u["senha_hash"]):
+            if precisa_rehash(u["senha_hash"]):
+                # Migra hashes antigos (SHA256) para PBKDF2 no primeiro login bem-sucedido
+                with get_db_connection() as conn:
+                    with conn.cursor() as cur:
+                        executar_preparado(
+                            cur, "atualizar_hash_senha", SQL_ATUALIZAR_HASH_SENHA, (hash_password(senha), u["id"])
+                        )
+                        conn.commit()
+                limpar_cache_usuarios()
+            _iniciar_gravador_logins()
+            _fila_logins.put(u["id"])
+            return u
+        return None
     except Exception as e:
         st.error(f"Erro autenticação: {str(e)}")
         return None
@@ -64,7 +108,6 @@ def criar_usuario(dados_usuario):
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
                 cur.execute("""
                     SELECT COUNT(*) FROM usuarios
                     WHERE username = %s OR email = %s
@@ -88,29 +131,44 @@ def criar_usuario(dados_usuario):
                     True
                 ))
                 conn.commit()
+                limpar_cache_usuarios()
                 return True, "Usuário criado com sucesso."
     except Exception as e:
         return False, f"Erro criar usuário: {str(e)}"
 
 
-def listar_usuarios():
-    """Lista todos os usuários com dados formatados."""
+@st.cache_data(ttl=60, show_spinner=False)
+def _consultar_usuarios():
+    """Consulta os usuários no banco (resultado em cache; exceções não são cacheadas)."""
+    import pandas as pd
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, nome, email, username, departamento,
+                       nivel_acesso, is_admin, ativo,
+                       TO_CHAR(data_cadastro AT TIME ZONE 'America/Fortaleza', 'DD/MM/YYYY') as data_cadastro,
+                       TO_CHAR(ultimo_login AT TIME ZONE 'America/Fortaleza', 'DD/MM/YYYY HH24:MI') as ultimo_login
+                FROM usuarios
+                ORDER BY nome
+            """)
+            colunas = [c.name for c in cur.description]
+            return pd.DataFrame(cur.fetchall(), columns=colunas)
+
+
+def limpar_cache_usuarios():
+    """Invalida o cache de usuários após uma escrita."""
+    _consultar_usuarios.clear()
+    _buscar_usuario_login.clear()
+
+
+def listar_usuarios() -> "pd.DataFrame":
+    """Lista todos os usuários com dados formatados, já como DataFrame."""
+    import pandas as pd
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
-                cur.execute("""
-                    SELECT id, nome, email, username, departamento,
-                           nivel_acesso, is_admin, ativo,
-                           TO_CHAR(data_cadastro AT TIME ZONE 'America/Fortaleza', 'DD/MM/YYYY') as data_cadastro,
-                           TO_CHAR(ultimo_login AT TIME ZONE 'America/Fortaleza', 'DD/MM/YYYY HH24:MI') as ultimo_login
-                    FROM usuarios
-                    ORDER BY nome
-                """)
-                return cur.fetchall()
+        return _consultar_usuarios()
     except Exception as e:
         st.error(f"Erro listar usuários: {str(e)}")
-        return []
+        return pd.DataFrame()
 
 
 def atualizar_usuario(usuario_id, dados_atualizados):
@@ -118,7 +176,6 @@ def atualizar_usuario(usuario_id, dados_atualizados):
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
                 campos = []
                 valores = []
                 for campo, valor in dados_atualizados.items():
@@ -135,6 +192,7 @@ def atualizar_usuario(usuario_id, dados_atualizados):
                 valores.append(usuario_id)
                 cur.execute(f"UPDATE usuarios SET {', '.join(campos)} WHERE id = %s", valores)
                 conn.commit()
+                limpar_cache_usuarios()
                 return True, "Usuário atualizado."
     except Exception as e:
         return False, f"Erro atualizar usuário: {str(e)}"
@@ -147,9 +205,9 @@ def desativar_usuario(usuario_id):
             return False, "Não dá pra desativar o admin principal."
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
                 cur.execute("UPDATE usuarios SET ativo = FALSE WHERE id = %s", (usuario_id,))
                 conn.commit()
+                limpar_cache_usuarios()
                 return True, "Usuário desativado."
     except Exception as e:
         return False, f"Erro desativar usuário: {str(e)}"
@@ -157,16 +215,30 @@ def desativar_usuario(usuario_id):
 # =============================
 # Código ddmmaa-xx
 # =============================
+# Contador por dia em contador_codigos: o UPSERT trava a linha do dia até o commit,
+# então transações concorrentes recebem faixas diferentes (sem UniqueViolation/retry).
+# No primeiro uso do dia o contador parte do maior código já existente.
+SQL_RESERVAR_CODIGOS = """
+    INSERT INTO contador_codigos (prefixo, ultimo)
+    SELECT $1, COALESCE(MAX(NULLIF(SPLIT_PART(codigo, '-', 2), '')::int), 0) + $2
+    FROM demandas
+    WHERE codigo LIKE $1 || '-%'
+    ON CONFLICT (prefixo) DO UPDATE SET ultimo = contador_codigos.ultimo + $2
+    RETURNING ultimo
+"""
+
+
+def gerar_codigos_demanda(cur, quantidade: int = 1) -> list:
+    """Reserva `quantidade` códigos de demanda consecutivos no formato ddmmaa-xx."""
+    prefixo = agora_fortaleza().strftime("%d%m%y")
+    executar_preparado(cur, "reservar_codigos", SQL_RESERVAR_CODIGOS, (prefixo, quantidade))
+    ultimo = cur.fetchone()[0]
+    return [f"{prefixo}-{seq:02d}" for seq in range(ultimo - quantidade + 1, ultimo + 1)]
+
+
 def gerar_codigo_demanda(cur) -> str:
     """Gera um código de demanda único no formato ddmmaa-xx."""
-    prefixo = agora_fortaleza().strftime("%d%m%y")
-    cur.execute("""
-        SELECT COALESCE(MAX(NULLIF(SPLIT_PART(codigo, '-', 2), '')::int), 0)
-        FROM demandas
-        WHERE codigo LIKE %s
-    """, (f"{prefixo}-%",))
-    max_seq = cur.fetchone()[0] or 0
-    return f"{prefixo}-{(max_seq + 1):02d}"
+    return gerar_codigos_demanda(cur)[0]
 
 
 def normalizar_busca_codigo(texto: str) -> str:
@@ -182,200 +254,349 @@ def normalizar_busca_codigo(texto: str) -> str:
 # =============================
 # Demandas (CRUD)
 # =============================
+# Insere a demanda e o registro de CRIAÇÃO no histórico num único comando
+SQL_INSERIR_DEMANDA = """
+    WITH nova AS (
+        INSERT INTO demandas
+        (codigo, item, quantidade, solicitante, departamento, local, prioridade,
+         observacoes, categoria, unidade, urgencia, estimativa_horas, almoxarifado, valor)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
+        RETURNING id, codigo, item, quantidade, solicitante, departamento, local, prioridade,
+                  observacoes, categoria, unidade, urgencia, almoxarifado, valor
+    ), historico AS (
+        INSERT INTO historico_demandas (demanda_id, usuario, acao, detalhes)
+        SELECT id, solicitante, 'CRIAÇÃO', to_jsonb(nova) - 'id' FROM nova
+    )
+    SELECT id, codigo FROM nova
+"""
+
+SQL_EXCLUIR_DEMANDA = "DELETE FROM demandas WHERE id = $1"
+
+
+def _valores_demanda(codigo: str, dados: dict) -> tuple:
+    """Valores de INSERT de uma demanda, na ordem das colunas de SQL_INSERIR_DEMANDA."""
+    return (
+        codigo,
+        dados["item"],
+        dados["quantidade"],
+        dados["solicitante"],
+        dados["departamento"],
+        dados.get("local", "Gerência"),
+        dados["prioridade"],
+        dados.get("observacoes", ""),
+        dados.get("categoria", "Geral"),
+        dados.get("unidade", "Unid."),
+        bool(dados.get("urgencia", False)),
+        None,
+        bool(dados.get("almoxarifado", False)),
+        dados.get("valor"),
+    )
+
+
+# Filtros aceitos por carregar_demandas/obter_estatisticas, na ordem dos bits da
+# máscara que identifica cada combinação ("formato") de filtros presentes.
+_FILTROS_DEMANDAS = (
+    ("solicitante", "solicitante ILIKE {}"),
+    ("codigo", "codigo = {}"),
+    ("status", "status = ANY({})"),
+    ("prioridade", "prioridade = ANY({})"),
+    ("data_inicio", "data_criacao >= {}"),
+    ("data_fim", "data_criacao < {}"),
+    # Busca livre por trecho na descrição ou no solicitante (índice GIN de trigramas)
+    ("busca", "(item || ' ' || solicitante) ILIKE {}"),
+    ("id", "id = {}"),
+)
+_BIT_APOS = 1 << len(_FILTROS_DEMANDAS)
+_BIT_LIMITE = _BIT_APOS << 1
+
+
+def _filtros_demandas(filtros) -> tuple:
+    """Retorna (máscara, parâmetros) dos filtros presentes em `filtros`."""
+    mascara = 0
+    params = []
+    for bit, (chave, _) in enumerate(_FILTROS_DEMANDAS):
+        valor = (filtros or {}).get(chave)
+        if not valor:
+            continue
+        if chave in ("solicitante", "busca"):
+            valor = f"%{valor}%"
+        elif chave == "codigo":
+            valor = normalizar_busca_codigo(valor)
+        mascara |= 1 << bit
+        params.append(valor)
+    return mascara, params
+
+
+def _marcador(estilo: str, n: int) -> str:
+    """Placeholder do n-ésimo parâmetro: "$n" (PREPARE) ou "%s" (psycopg2)."""
+    return f"${n}" if estilo == "$" else "%s"
+
+
+@lru_cache(maxsize=None)
+def _where_demandas(mascara: int, estilo: str = "$") -> tuple:
+    """Monta uma única vez por máscara a lista de condições com placeholders."""
+    condicoes = []
+    for bit, (_, expressao) in enumerate(_FILTROS_DEMANDAS):
+        if mascara & (1 << bit):
+            condicoes.append(expressao.format(_marcador(estilo, len(condicoes) + 1)))
+    return tuple(condicoes)
+
+
+@lru_cache(maxsize=None)
+def _sql_consultar_demandas(mascara: int, estilo: str = "$") -> str:
+    """SQL de carregar_demandas para uma combinação de filtros (uma vez por máscara)."""
+    condicoes = list(_where_demandas(mascara & (_BIT_APOS - 1), estilo))
+    n = len(condicoes)
+    if mascara & _BIT_APOS:
+        condicoes.append(f"(data_criacao, id) < ({_marcador(estilo, n + 1)}, {_marcador(estilo, n + 2)})")
+        n += 2
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    sql = f"""
+        SELECT id, codigo, item, quantidade, solicitante, departamento, local, prioridade,
+               observacoes, status, data_criacao, data_atualizacao, categoria, unidade,
+               urgencia, estimativa_horas, almoxarifado, valor,
+               COALESCE(TO_CHAR(data_criacao AT TIME ZONE 'America/Fortaleza', 'DD/MM/YYYY HH24:MI'), '') as data_criacao_formatada,
+               COALESCE(TO_CHAR(data_atualizacao AT TIME ZONE 'America/Fortaleza', 'DD/MM/YYYY HH24:MI'), '') as data_atualizacao_formatada
+        FROM demandas
+        {where}
+        ORDER BY data_criacao DESC, id DESC
+    """
+    if mascara & _BIT_LIMITE:
+        sql += f" LIMIT {_marcador(estilo, n + 1)} OFFSET {_marcador(estilo, n + 2)}"
+    return sql
+
+
+@lru_cache(maxsize=None)
+def _sql_resumo_demandas(mascara: int) -> str:
+    """SQL de listar_demandas_resumo: só o necessário para montar um seletor."""
+    condicoes = _where_demandas(mascara)
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return f"""
+        SELECT id, codigo, solicitante, LEFT(item, 50) as item
+        FROM demandas
+        {where}
+        ORDER BY data_criacao DESC, id DESC
+        LIMIT ${len(condicoes) + 1}
+    """
+
+
+def _linhas_como_dicts(cur) -> list:
+    """Monta dicts simples a partir das tuplas do cursor (sem RealDictCursor)."""
+    colunas = [c.name for c in cur.description]
+    return [dict(zip(colunas, r)) for r in cur.fetchall()]
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _consultar_demandas(filtros=None):
+    """Consulta as demandas no banco (resultado em cache; exceções não são cacheadas)."""
+    mascara, params = _filtros_demandas(filtros)
+    if filtros and filtros.get("apos"):
+        # Paginação por chave: continua depois da última (data_criacao, id) vista
+        mascara |= _BIT_APOS
+        params.extend(filtros["apos"])
+    if filtros and filtros.get("limite"):
+        mascara |= _BIT_LIMITE
+        params.extend([int(filtros["limite"]), int(filtros.get("offset") or 0)])
+
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cur:
+            executar_preparado(cur, f"consultar_demandas_{mascara}", _sql_consultar_demandas(mascara), params)
+            return _linhas_como_dicts(cur)
+
+
+def iterar_demandas(filtros=None, lote: int = 500):
+    """
+    Percorre as demandas filtradas com um cursor no servidor, trazendo `lote`
+    linhas por vez. Sem cache: serve para exportações grandes sem fetchall.
+    """
+    mascara, params = _filtros_demandas(filtros)
+    with get_db_connection() as conn:
+        with conn.cursor(name="demandas_stream") as cur:
+            cur.itersize = lote
+            cur.execute(_sql_consultar_demandas(mascara, "%s"), params)
+            colunas = None
+            for r in cur:
+                if colunas is None:
+                    colunas = [c.name for c in cur.description]
+                yield dict(zip(colunas, r))
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _consultar_resumo_demandas(filtros=None, limite: int = 200):
+    """Consulta o resumo das demandas no banco (resultado em cache)."""
+    mascara, params = _filtros_demandas(filtros)
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cur:
+            executar_preparado(cur, f"resumo_demandas_{mascara}", _sql_resumo_demandas(mascara), [*params, int(limite)])
+            return _linhas_como_dicts(cur)
+
+
+def limpar_cache_demandas():
+    """Invalida o cache de demandas após uma escrita (o das estatísticas, após o REFRESH)."""
+    _consultar_demandas.clear()
+    _consultar_resumo_demandas.clear()
+    _iniciar_atualizador_estatisticas()
+    _estatisticas_desatualizadas.set()
+
+
 def carregar_demandas(filtros=None):
-    """Carrega demandas do banco de dados com filtros opcionais."""
+    """
+    Carrega demandas do banco de dados com filtros opcionais.
+
+    Paginação opcional via filtros["limite"] / filtros["offset"], ou por chave
+    com filtros["apos"] = (data_criacao, id) da última linha da página anterior.
+    """
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
-
-                query = """
-                    SELECT id, codigo, item, quantidade, solicitante, departamento, local, prioridade,
-                           observacoes, status, data_criacao, data_atualizacao, categoria, unidade,
-                           urgencia, estimativa_horas, almoxarifado, valor
-                    FROM demandas
-                """
-                where = "WHERE 1=1"
-                params = []
-
-                if filtros:
-                    if filtros.get("solicitante"):
-                        where += " AND solicitante ILIKE %s"
-                        params.append(f"%{filtros['solicitante']}%")
-                    if filtros.get("codigo"):
-                        where += " AND codigo = %s"
-                        params.append(normalizar_busca_codigo(filtros["codigo"]))
-                    if filtros.get("status"):
-                        where += " AND status = ANY(%s)"
-                        params.append(filtros["status"])
-                    if filtros.get("prioridade"):
-                        where += " AND prioridade = ANY(%s)"
-                        params.append(filtros["prioridade"])
-                    if filtros.get("data_inicio"):
-                        where += " AND data_criacao >= %s"
-                        params.append(filtros["data_inicio"])
-                    if filtros.get("data_fim"):
-                        where += " AND data_criacao < %s"
-                        params.append(filtros["data_fim"])
-
-                query += f" {where} ORDER BY data_criacao DESC"
-
-                cur.execute(query, params)
-                demandas = cur.fetchall()
-
-                for d in demandas:
-                    d["data_criacao_formatada"] = formatar_data_hora_fortaleza(d.get("data_criacao"))
-                    d["data_atualizacao_formatada"] = formatar_data_hora_fortaleza(d.get("data_atualizacao"))
-
-                return demandas
+        return _consultar_demandas(filtros)
     except Exception as e:
         st.error(f"Erro ao carregar demandas: {str(e)}")
         return []
 
 
-def carregar_historico_demanda(demanda_id: int):
-    """Carrega o histórico de ações de uma demanda."""
+def listar_demandas_resumo(filtros=None, limite: int = 200):
+    """Lista id, código, solicitante e início do item das demandas mais recentes (para seletores)."""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
-                cur.execute("""
-                    SELECT id, usuario, acao, detalhes, data_acao
-                    FROM historico_demandas
-                    WHERE demanda_id = %s
-                    ORDER BY data_acao DESC
-                """, (demanda_id,))
-                rows = cur.fetchall()
-                for r in rows:
-                    r["data_acao_formatada"] = formatar_data_hora_fortaleza(r.get("data_acao"))
-                return rows
+        return _consultar_resumo_demandas(filtros, limite)
     except Exception as e:
-        st.warning(f"Não foi possível carregar histórico: {str(e)}")
+        st.error(f"Erro ao listar demandas: {str(e)}")
         return []
 
 
+def obter_demanda(demanda_id: int):
+    """Carrega uma única demanda pelo id (ou None se não existir)."""
+    demandas = carregar_demandas({"id": int(demanda_id)})
+    return demandas[0] if demandas else None
+
+
+SQL_HISTORICO_DEMANDAS = """
+    SELECT id, demanda_id, usuario, acao, detalhes, data_acao,
+           COALESCE(TO_CHAR(data_acao AT TIME ZONE 'America/Fortaleza', 'DD/MM/YYYY HH24:MI'), '') as data_acao_formatada
+    FROM historico_demandas
+    WHERE demanda_id = ANY($1::int[])
+    ORDER BY demanda_id, data_acao DESC
+"""
+
+
+def carregar_historicos_demandas(demanda_ids) -> dict:
+    """Carrega numa única consulta o histórico de várias demandas: {demanda_id: [ações]}."""
+    ids = [int(i) for i in demanda_ids]
+    if not ids:
+        return {}
+    try:
+        with get_db_connection(readonly=True) as conn:
+            with conn.cursor() as cur:
+                executar_preparado(cur, "historicos_demandas", SQL_HISTORICO_DEMANDAS, (ids,))
+                historicos = {}
+                for h in _linhas_como_dicts(cur):
+                    historicos.setdefault(h["demanda_id"], []).append(h)
+                return historicos
+    except Exception as e:
+        st.warning(f"Não foi possível carregar histórico: {str(e)}")
+        return {}
+
+
+def carregar_historico_demanda(demanda_id: int):
+    """Carrega o histórico de ações de uma demanda."""
+    return carregar_historicos_demandas([demanda_id]).get(int(demanda_id), [])
+
+
 def adicionar_demanda(dados):
     """Adiciona uma nova demanda e registra no histórico."""
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
-
-                # Tenta gerar código único (até 8 vezes)
-                for _ in range(8):
-                    codigo = gerar_codigo_demanda(cur)
-                    try:
-                        cur.execute("""
-                            INSERT INTO demandas
-                            (codigo, item, quantidade, solicitante, departamento, local, prioridade,
-                             observacoes, categoria, unidade, urgencia, estimativa_horas, almoxarifado, valor)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            RETURNING id, codigo
-                        """, (
-                            codigo,
-                            dados["item"],
-                            dados["quantidade"],
-                            dados["solicitante"],
-                            dados["departamento"],
-                            dados.get("local", "Gerência"),
-                            dados["prioridade"],
-                            dados.get("observacoes", ""),
-                            dados.get("categoria", "Geral"),
-                            dados.get("unidade", "Unid."),
-                            bool(dados.get("urgencia", False)),
-                            None,
-                            bool(dados.get("almoxarifado", False)),
-                            dados.get("valor")
-                        ))
-                        nova_id, codigo_ok = cur.fetchone()
-
-                        cur.execute("""
-                            INSERT INTO historico_demandas (demanda_id, usuario, acao, detalhes)
-                            VALUES (%s, %s, %s, %s)
-                        """, (nova_id, dados["solicitante"], "CRIAÇÃO", dumps_safe(dados)))
-
-                        conn.commit()
+                codigo = gerar_codigo_demanda(cur)
+                executar_preparado(cur, "inserir_demanda", SQL_INSERIR_DEMANDA, _valores_demanda(codigo, dados))
+                nova_id, codigo_ok = cur.fetchone()
 
-                        # Envio de e-mail (lógica de negócio)
-                        ok_mail, msg_mail = enviar_email_nova_demanda({
-                            "codigo": codigo_ok,
-                            "solicitante": dados.get("solicitante", ""),
-                            "departamento": dados.get("departamento", ""),
-                            "local": dados.get("local", "Gerência"),
-                            "prioridade": dados.get("prioridade", ""),
-                            "item": dados.get("item", ""),
-                            "quantidade": dados.get("quantidade", ""),
-                            "unidade": dados.get("unidade", ""),
-                            "urgencia": bool(dados.get("urgencia", False)),
-                            "categoria": dados.get("categoria", "Geral"),
-                            "observacoes": dados.get("observacoes", ""),
-                        })
-
-                        return {
-                            "id": nova_id,
-                            "codigo": codigo_ok,
-                            "email_ok": ok_mail,
-                            "email_msg": msg_mail
-                        }
-                    except psycopg2.errors.UniqueViolation:
-                        conn.rollback()
-                        # Tenta novamente com novo código
-                        continue
-                
-                return None
+                conn.commit()
+                limpar_cache_demandas()
+
+        # Envio de e-mail (lógica de negócio) em segundo plano, já fora da transação
+        ok_mail, msg_mail = agendar_email_nova_demanda({
+            "codigo": codigo_ok,
+            "solicitante": dados.get("solicitante", ""),
+            "departamento": dados.get("departamento", ""),
+            "local": dados.get("local", "Gerência"),
+            "prioridade": dados.get("prioridade", ""),
+            "item": dados.get("item", ""),
+            "quantidade": dados.get("quantidade", ""),
+            "unidade": dados.get("unidade", ""),
+            "urgencia": bool(dados.get("urgencia", False)),
+            "categoria": dados.get("categoria", "Geral"),
+            "observacoes": dados.get("observacoes", ""),
+        })
+
+        return {
+            "id": nova_id,
+            "codigo": codigo_ok,
+            "email_ok": ok_mail,
+            "email_msg": msg_mail
+        }
     except Exception as e:
         st.error(f"Erro ao adicionar demanda: {str(e)}")
         return None
 
 
+@lru_cache(maxsize=64)
+def _sql_atualizar_demanda(campos: tuple) -> str:
+    """
+    SQL de atualizar_demanda para um conjunto de campos (montado uma vez por conjunto).
+    Num único comando: trava a linha antiga, atualiza apenas se algum campo
+    mudou e grava no histórico só os campos alterados.
+    """
+    atribuicoes = ", ".join(f"{campo} = %s" for campo in campos)
+    mudou = " OR ".join(f"d.{campo} IS DISTINCT FROM %s" for campo in campos)
+    return f"""
+        WITH antigo AS (
+            SELECT * FROM demandas WHERE id = %s FOR UPDATE
+        ), atualizado AS (
+            UPDATE demandas d
+            SET {atribuicoes}, data_atualizacao = CURRENT_TIMESTAMP
+            FROM antigo
+            WHERE d.id = antigo.id AND ({mudou})
+            RETURNING d.*
+        ), diferencas AS (
+            SELECT atualizado.id, campo,
+                   to_jsonb(antigo) -> campo AS antes,
+                   to_jsonb(atualizado) -> campo AS depois
+            FROM antigo, atualizado, unnest(%s::text[]) AS campo
+            WHERE (to_jsonb(antigo) -> campo) IS DISTINCT FROM (to_jsonb(atualizado) -> campo)
+        ), historico AS (
+            INSERT INTO historico_demandas (demanda_id, usuario, acao, detalhes)
+            SELECT id, %s, 'ATUALIZAÇÃO', jsonb_build_object(
+                'antigo', jsonb_object_agg(campo, antes),
+                'novo', jsonb_object_agg(campo, depois)
+            )
+            FROM diferencas
+            GROUP BY id
+        )
+        SELECT EXISTS (SELECT 1 FROM atualizado) AS alterado
+        FROM antigo
+    """
+
+
 def atualizar_demanda(demanda_id: int, dados_atualizados: dict) -> bool:
     """Atualiza uma demanda e registra a alteração no histórico."""
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
+    if not dados_atualizados:
+        return True # Nada para atualizar
 
-                # 1. Obter dados antigos para histórico
-                cur.execute("SELECT * FROM demandas WHERE id = %s", (demanda_id,))
-                demanda_antiga = cur.fetchone()
+    try:
+        usuario_acao = st.session_state.usuario_logado.get("username", "Sistema") if st.session_state.usuario_logado else "Sistema"
 
-                if not demanda_antiga:
+        campos = tuple(dados_atualizados)
+        valores = list(dados_atualizados.values())
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    _sql_atualizar_demanda(campos),
+                    [demanda_id, *valores, *valores, list(campos), usuario_acao],
+                )
+                if cur.fetchone() is None:
                     return False
 
-                # 2. Construir query de atualização
-                campos = []
-                valores = []
-                detalhes_historico = {"antigo": {}, "novo": {}}
-
-                for campo, valor in dados_atualizados.items():
-                    # Ignora campos que não mudaram
-                    if campo in demanda_antiga and demanda_antiga[campo] == valor:
-                        continue
-
-                    campos.append(f"{campo} = %s")
-                    valores.append(valor)
-
-                    # Registra no histórico
-                    detalhes_historico["antigo"][campo] = demanda_antiga.get(campo)
-                    detalhes_historico["novo"][campo] = valor
-
-                if not campos:
-                    return True # Nada para atualizar
-
-                campos.append("data_atualizacao = CURRENT_TIMESTAMP")
-
-                # 3. Executar atualização
-                valores.append(demanda_id)
-                cur.execute(f"UPDATE demandas SET {', '.join(campos)} WHERE id = %s", valores)
-
-                # 4. Registrar histórico
-                usuario_acao = st.session_state.usuario_logado.get("username", "Sistema") if st.session_state.usuario_logado else "Sistema"
-                cur.execute("""
-                    INSERT INTO historico_demandas (demanda_id, usuario, acao, detalhes)
-                    VALUES (%s, %s, %s, %s)
-                """, (demanda_id, usuario_acao, "ATUALIZAÇÃO", dumps_safe(detalhes_historico)))
-
                 conn.commit()
+                limpar_cache_demandas()
                 return True
     except Exception as e:
         st.error(f"Erro ao atualizar demanda: {str(e)}")
@@ -387,101 +608,176 @@ def excluir_demanda(demanda_id: int) -> bool:
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
-                
                 # A exclusão do histórico é feita via ON DELETE CASCADE na tabela demandas
-                cur.execute("DELETE FROM demandas WHERE id = %s", (demanda_id,))
+                executar_preparado(cur, "excluir_demanda", SQL_EXCLUIR_DEMANDA, (demanda_id,))
                 conn.commit()
+                limpar_cache_demandas()
                 return True
     except Exception as e:
         st.error(f"Erro ao excluir demanda: {str(e)}")
         return False
 
 
+# Na view materializada o período vira um intervalo de dias locais (`dia`); vale só
+# para limites à meia-noite de Fortaleza, como os de _to_tz_aware_start/_end_exclusive.
+_FILTROS_MATERIALIZADA = {
+    "data_inicio": "dia >= ({}::timestamptz AT TIME ZONE 'America/Fortaleza')::date",
+    "data_fim": "dia < ({}::timestamptz AT TIME ZONE 'America/Fortaleza')::date",
+}
+
+
+@lru_cache(maxsize=None)
+def _where_estatisticas_materializada(mascara: int) -> tuple:
+    """Como _where_demandas, mas com os filtros de data sobre a coluna `dia` da view."""
+    condicoes = []
+    for bit, (chave, expressao) in enumerate(_FILTROS_DEMANDAS):
+        if mascara & (1 << bit):
+            expressao = _FILTROS_MATERIALIZADA.get(chave, expressao)
+            condicoes.append(expressao.format(_marcador("$", len(condicoes) + 1)))
+    return tuple(condicoes)
+
+
+@lru_cache(maxsize=None)
+def _sql_consultar_estatisticas(mascara: int, materializada: bool = False) -> str:
+    """SQL de obter_estatisticas para uma combinação de filtros (uma vez por máscara)."""
+    condicoes = _where_estatisticas_materializada(mascara) if materializada else _where_demandas(mascara)
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    # Na view materializada cada linha já é um grupo: soma-se a contagem n
+    if materializada:
+        origem, contagem, itens, valor = "mv_demandas_estatisticas", "SUM(n)", "SUM(itens)", "SUM(valor)"
+    else:
+        origem, contagem, itens, valor = "demandas", "COUNT(*)", "SUM(quantidade)", "SUM(valor)"
+    # Uma única varredura: totais e os três agrupamentos via GROUPING SETS.
+    # GROUPING(departamento, prioridade, status) identifica cada conjunto:
+    # 7 = totais, 3 = departamento, 5 = prioridade, 6 = status.
+    # O resultado já sai no formato final (objetos JSON); json_object_agg
+    # preserva a ordem das chaves, ao contrário do jsonb.
+    return f"""
+        WITH grupos AS (
+            SELECT
+                GROUPING(departamento, prioridade, status) as conjunto,
+                departamento, prioridade, status,
+                CASE WHEN GROUPING(prioridade) = 0 THEN MIN(prioridade_rank) END as ordem_prioridade,
+                {contagem}::bigint as total,
+                COALESCE({contagem} FILTER (WHERE status = 'Pendente'), 0)::bigint as pendentes,
+                COALESCE({contagem} FILTER (WHERE status = 'Em andamento'), 0)::bigint as em_andamento,
+                COALESCE({contagem} FILTER (WHERE status = 'Concluída'), 0)::bigint as concluidas,
+                COALESCE({contagem} FILTER (WHERE status = 'Cancelada'), 0)::bigint as canceladas,
+                COALESCE({contagem} FILTER (WHERE urgencia = TRUE), 0)::bigint as urgentes,
+                COALESCE({itens}, 0) as total_itens,
+                COALESCE({valor}, 0) as total_valor
+            FROM {origem}
+            {where}
+            GROUP BY GROUPING SETS ((), (departamento), (prioridade), (status))
+        )
+        SELECT
+            (SELECT to_json(t) FROM (
+                SELECT total, pendentes, em_andamento, concluidas, canceladas,
+                       urgentes, total_itens, total_valor
+                FROM grupos WHERE conjunto = 7
+            ) t) as totais,
+            (SELECT json_object_agg(departamento, total ORDER BY total DESC)
+             FROM grupos WHERE conjunto = 3 AND departamento IS NOT NULL) as por_departamento,
+            (SELECT json_object_agg(prioridade, total ORDER BY ordem_prioridade, total DESC)
+             FROM grupos WHERE conjunto = 5 AND prioridade IS NOT NULL) as por_prioridade,
+            (SELECT json_object_agg(status, total ORDER BY total DESC)
+             FROM grupos WHERE conjunto = 6 AND status IS NOT NULL) as por_status
+    """
+
+
+# Filtros que a view materializada atende (as demais colunas não existem nela)
+_MASCARA_MATERIALIZADA = sum(
+    1 << bit for bit, (chave, _) in enumerate(_FILTROS_DEMANDAS)
+    if chave in ("status", "prioridade", "data_inicio", "data_fim")
+)
+
+
+def _periodo_em_dias_inteiros(filtros) -> bool:
+    """True se data_inicio/data_fim (quando presentes) caem à meia-noite de Fortaleza."""
+    for chave in ("data_inicio", "data_fim"):
+        valor = (filtros or {}).get(chave)
+        if not valor:
+            continue
+        if not isinstance(valor, datetime) or valor.tzinfo is None:
+            return False
+        if valor.astimezone(FORTALEZA_TZ).time() != datetime.min.time():
+            return False
+    return True
+
+# A view é atualizada fora do caminho das escritas por uma thread: a cada
+# STATS_REFRESH_SEG (escritas de outros processos ou direto no banco) e logo após
+# o sinal de limpar_cache_demandas (várias escritas seguidas viram um único refresh).
+_estatisticas_desatualizadas = threading.Event()
+
+
+def _atualizar_estatisticas_pendentes():
+    """Loop da thread: aguarda o sinal ou o intervalo, faz o REFRESH CONCURRENTLY e limpa o cache."""
+    intervalo = max(_env_int("STATS_REFRESH_SEG", 60), 5)
+    while True:
+        if _estatisticas_desatualizadas.wait(timeout=intervalo):
+            time.sleep(2)
+        _estatisticas_desatualizadas.clear()
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_demandas_estatisticas")
+                    conn.commit()
+        except UndefinedTable:
+            # Sem a view (migração pendente) as estatísticas vêm direto da tabela
+            pass
+        except Exception:
+            # Cache mantido: limpá-lo só recarregaria a view ainda desatualizada
+            _log.exception("Falha ao atualizar mv_demandas_estatisticas")
+            continue
+        _consultar_estatisticas.clear()
+
+
+@st.cache_resource(show_spinner=False)
+def _iniciar_atualizador_estatisticas() -> threading.Thread:
+    """Sobe (uma única vez por processo) a thread que atualiza a view de estatísticas."""
+    t = threading.Thread(target=_atualizar_estatisticas_pendentes, name="atualizador_estatisticas", daemon=True)
+    t.start()
+    return t
+
+
+@st.cache_resource(show_spinner=False, ttl=300)
+def _view_estatisticas_disponivel() -> bool:
+    """True se a migração já criou mv_demandas_estatisticas."""
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('mv_demandas_estatisticas') IS NOT NULL")
+            return cur.fetchone()[0]
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _consultar_estatisticas(filtros=None):
+    """Consulta as estatísticas no banco (resultado em cache; exceções não são cacheadas)."""
+    mascara, params = _filtros_demandas(filtros)
+    materializada = (
+        not (mascara & ~_MASCARA_MATERIALIZADA)
+        and _periodo_em_dias_inteiros(filtros)
+        and _view_estatisticas_disponivel()
+    )
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cur:
+            nome = f"consultar_estatisticas_{'mv_' if materializada else ''}{mascara}"
+            executar_preparado(cur, nome, _sql_consultar_estatisticas(mascara, materializada), params)
+
+            totais, por_departamento, por_prioridade, por_status = cur.fetchone()
+            estat = {
+                "totais": totais or {},
+                "por_departamento": por_departamento or {},
+                "por_prioridade": por_prioridade or {},
+                "por_status": por_status or {},
+            }
+            return estat
+
+
 def obter_estatisticas(filtros=None):
     """Calcula e retorna estatísticas agregadas das demandas com filtros."""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
-
-                where = "WHERE 1=1"
-                params = []
-
-                if filtros:
-                    if filtros.get("solicitante"):
-                        where += " AND solicitante ILIKE %s"
-                        params.append(f"%{filtros['solicitante']}%")
-                    if filtros.get("codigo"):
-                        where += " AND codigo = %s"
-                        params.append(normalizar_busca_codigo(filtros["codigo"]))
-                    if filtros.get("data_inicio"):
-                        where += " AND data_criacao >= %s"
-                        params.append(filtros["data_inicio"])
-                    if filtros.get("data_fim"):
-                        where += " AND data_criacao < %s"
-                        params.append(filtros["data_fim"])
-                    if filtros.get("status"):
-                        where += " AND status = ANY(%s)"
-                        params.append(filtros["status"])
-                    if filtros.get("prioridade"):
-                        where += " AND prioridade = ANY(%s)"
-                        params.append(filtros["prioridade"])
-
-                estat = {}
-
-                # Estatísticas gerais
-                cur.execute(f"""
-                    SELECT
-                        COUNT(*) as total,
-                        COUNT(CASE WHEN status = 'Pendente' THEN 1 END) as pendentes,
-                        COUNT(CASE WHEN status = 'Em andamento' THEN 1 END) as em_andamento,
-                        COUNT(CASE WHEN status = 'Concluída' THEN 1 END) as concluidas,
-                        COUNT(CASE WHEN status = 'Cancelada' THEN 1 END) as canceladas,
-                        COUNT(CASE WHEN urgencia = TRUE THEN 1 END) as urgentes,
-                        COALESCE(SUM(quantidade), 0) as total_itens,
-                        COALESCE(SUM(valor), 0) as total_valor
-                    FROM demandas
-                    {where}
-                """, params)
-                estat["totais"] = cur.fetchone() or {}
-
-                # Por departamento
-                cur.execute(f"""
-                    SELECT departamento, COUNT(*) as quantidade
-                    FROM demandas
-                    {where}
-                    GROUP BY departamento
-                    ORDER BY quantidade DESC
-                """, params)
-                estat["por_departamento"] = {r["departamento"]: r["quantidade"] for r in cur.fetchall()}
-
-                # Por prioridade
-                cur.execute(f"""
-                    SELECT prioridade, COUNT(*) as quantidade
-                    FROM demandas
-                    {where}
-                    GROUP BY prioridade
-                    ORDER BY
-                        CASE prioridade
-                            WHEN 'Urgente' THEN 1
-                            WHEN 'Alta' THEN 2
-                            WHEN 'Média' THEN 3
-                            ELSE 4
-                        END
-                """, params)
-                estat["por_prioridade"] = {r["prioridade"]: r["quantidade"] for r in cur.fetchall()}
-
-                # Por status
-                cur.execute(f"""
-                    SELECT status, COUNT(*) as quantidade
-                    FROM demandas
-                    {where}
-                    GROUP BY status
-                """, params)
-                estat["por_status"] = {r["status"]: r["quantidade"] for r in cur.fetchall()}
-
-                return estat
+        _iniciar_atualizador_estatisticas()
+        return _consultar_estatisticas(filtros)
     except Exception as e:
         st.error(f"Erro ao obter estatísticas: {str(e)}")
         return {}
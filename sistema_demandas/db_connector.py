@@ -1,39 +1,123 @@
 # db_connector.py
 
+import re
+import threading
+from functools import lru_cache
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from contextlib import contextmanager
-from .config import get_db_config
+import streamlit as st
+from .config import get_db_config, _env_int
+
+
+class _ConexaoPreparada(psycopg2.extensions.connection):
+    """Conexão que lembra quais prepared statements já foram criados nela."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparados = set()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_pool() -> ThreadedConnectionPool:
+    """
+    Cria (uma única vez por processo) o pool de conexões com o PostgreSQL.
+    O st.cache_resource mantém o pool entre os reruns do Streamlit.
+    """
+    config = get_db_config()
+    # O PgBouncer (modo transaction) não repassa parâmetros de sessão; as datas
+    # já são formatadas com AT TIME ZONE 'America/Fortaleza' no SQL.
+    opcoes = {} if config.get("pgbouncer") else {"options": "-c TimeZone=America/Fortaleza"}
+    pool = ThreadedConnectionPool(
+        minconn=_env_int("DB_POOL_MIN", 1),
+        maxconn=_env_int("DB_POOL_MAX", 20),
+        host=config["host"],
+        database=config["database"],
+        user=config["user"],
+        password=config["password"],
+        port=config["port"],
+        sslmode=config.get("sslmode", "require"),
+        connect_timeout=10,
+        connection_factory=_ConexaoPreparada,
+        **opcoes,
+    )
+    # getconn() falha na hora com o pool esgotado; o semáforo faz quem chega esperar uma vaga
+    pool.vagas = threading.BoundedSemaphore(pool.maxconn)
+    return pool
+
 
 @contextmanager
-def get_db_connection():
+def get_db_connection(readonly: bool = False):
     """
     Context manager para gerenciar a conexão com o banco de dados PostgreSQL.
-    Garante que a conexão seja fechada automaticamente.
+    A conexão vem do pool e é devolvida a ele automaticamente; com o pool
+    esgotado, espera até DB_POOL_TIMEOUT segundos por uma vaga.
+
+    Com readonly=True a conexão fica em autocommit (flag só do cliente), evitando
+    o BEGIN/ROLLBACK implícito em consultas que só fazem SELECT.
     """
-    config = get_db_config()
-    conn = None
+    pool = _get_pool()
+    if not pool.vagas.acquire(timeout=_env_int("DB_POOL_TIMEOUT", 30)):
+        raise PoolError("Tempo esgotado aguardando conexão livre no pool")
+    try:
+        conn = pool.getconn()
+    except Exception:
+        pool.vagas.release()
+        raise
     try:
-        conn = psycopg2.connect(
-            host=config["host"],
-            database=config["database"],
-            user=config["user"],
-            password=config["password"],
-            port=config["port"],
-            sslmode=config.get("sslmode", "require"),
-            connect_timeout=10,
-        )
-        conn.autocommit = False
+        conn.autocommit = readonly
         yield conn
     finally:
-        if conn:
-            conn.close()
+        descartar = bool(conn.closed)
+        if not descartar:
+            try:
+                if readonly:
+                    conn.autocommit = False
+                else:
+                    # Descarta transação pendente antes de devolver ao pool
+                    conn.rollback()
+            except Exception:
+                descartar = True
+        pool.putconn(conn, close=descartar)
+        pool.vagas.release()
+
+
+@lru_cache(maxsize=None)
+def _sql_sem_prepare(sql: str) -> tuple:
+    """Converte $1, $2... para %s; retorna (sql, ordem dos parâmetros)."""
+    ordem = tuple(int(n) - 1 for n in re.findall(r"\$(\d+)", sql))
+    return re.sub(r"\$\d+", "%s", sql.replace("%", "%%")), ordem
+
+
+def executar_preparado(cur, nome: str, sql: str, params=()):
+    """
+    Executa `sql` (com placeholders $1, $2...) como prepared statement `nome`.
+    O PREPARE roda só na primeira vez em cada conexão física do pool; depois
+    apenas o EXECUTE é enviado, sem novo parse/plan no servidor.
+
+    Atrás do PgBouncer em modo transaction não há sessão fixa para guardar o
+    PREPARE, então o SQL é executado diretamente.
+    """
+    if get_db_config().get("pgbouncer"):
+        sql_direto, ordem = _sql_sem_prepare(sql)
+        cur.execute(sql_direto, [params[i] for i in ordem])
+        return
+
+    preparados = cur.connection.preparados
+    if nome not in preparados:
+        cur.execute(f"PREPARE {nome} AS {sql}")
+        preparados.add(nome)
+    if params:
+        cur.execute(f"EXECUTE {nome}({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {nome}")
 
 
 def test_db_connection():
     """Testa a conexão com o banco de dados."""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(readonly=True) as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT version();")
                 v = cur.fetchone()
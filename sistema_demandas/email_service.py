@@ -1,13 +1,41 @@
 # email_service.py
 
 import os
+import logging
 import smtplib
 import socket
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from email.message import EmailMessage
 from .config import get_email_config, get_brevo_config, _env_int
 from .email_html import gerar_comprovante_html
 
+# Envio fora do caminho da requisição: a demanda é gravada e a tela responde
+# sem esperar a API Brevo / SMTP. As threads sobem sob demanda.
+_EXECUTOR_EMAIL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="email")
+_log = logging.getLogger(__name__)
+
+# Sessão HTTP reutilizada entre envios: mantém a conexão TLS com a Brevo aberta
+_BREVO_SESSION = requests.Session()
+_BREVO_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    # O POST de envio não é idempotente: só repete quando a mensagem com certeza não foi
+    # aceita (falha de conexão ou 429); 5xx e erros de leitura não são repetidos.
+    max_retries=Retry(
+        total=2,
+        connect=2,
+        read=0,
+        status=2,
+        status_forcelist=[429],
+        allowed_methods=frozenset({"POST"}),
+        backoff_factor=0.2,
+        respect_retry_after_header=True,
+    ),
+))
+
 def _tcp_probe(host: str, port: int, timeout: int = 5) -> tuple:
     """Verifica se a porta TCP está aberta no host."""
     try:
@@ -42,7 +70,7 @@ def enviar_email_brevo_api(assunto: str, corpo_texto: str, corpo_html: str) -> t
     }
 
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=cfg["timeout"])
+        r = _BREVO_SESSION.post(url, headers=headers, json=payload, timeout=cfg["timeout"])
         if 200 <= r.status_code < 300:
             return True, "E-mail enviado ao responsável"
         return False, f"Brevo API erro {r.status_code}. {r.text}"
@@ -61,11 +89,7 @@ def enviar_email_smtp(assunto: str, corpo_texto: str, corpo_html: str) -> tuple:
 
     mail_from = cfg["from"] or cfg["user"]
 
-    # Probe TCP para erro mais claro
     timeout_int = _env_int("MAIL_SEND_TIMEOUT", 20)
-    ok_tcp, msg_tcp = _tcp_probe(cfg["host"], cfg["port"], timeout=min(6, timeout_int))
-    if not ok_tcp:
-        return False, f"TCP timeout em {cfg['host']}:{cfg['port']}. {msg_tcp}"
 
     msg = EmailMessage()
     msg["Subject"] = assunto
@@ -88,6 +112,12 @@ def enviar_email_smtp(assunto: str, corpo_texto: str, corpo_html: str) -> tuple:
             server.login(cfg["user"], cfg["password"])
             server.send_message(msg, from_addr=mail_from, to_addrs=destinos)
         return True, "SMTP OK"
+    except OSError as e:
+        # Falha de rede: só agora faz o probe TCP, para uma mensagem de erro mais clara
+        ok_tcp, msg_tcp = _tcp_probe(cfg["host"], cfg["port"], timeout=min(6, timeout_int))
+        if not ok_tcp:
+            return False, f"TCP timeout em {cfg['host']}:{cfg['port']}. {msg_tcp}"
+        return False, str(e)
     except Exception as e:
         return False, str(e)
 
@@ -155,3 +185,21 @@ def enviar_email_nova_demanda(dados_email: dict) -> tuple:
         return False, f"SMTP falhou. {msg_smtp}. API também falhou. {msg_api}"
 
     return False, f"Falha ao enviar email. {msg_smtp}"
+
+
+def _registrar_resultado_email(codigo: str, future) -> None:
+    """Callback do envio em segundo plano: registra no log quando o e-mail falha."""
+    try:
+        ok, msg = future.result()
+    except Exception as e:
+        ok, msg = False, str(e)
+    if not ok:
+        _log.warning("Falha ao enviar e-mail da demanda %s: %s", codigo, msg)
+
+
+def agendar_email_nova_demanda(dados_email: dict) -> tuple:
+    """Agenda o e-mail de nova demanda numa thread e retorna imediatamente."""
+    future = _EXECUTOR_EMAIL.submit(enviar_email_nova_demanda, dict(dados_email))
+    codigo = dados_email.get("codigo", "SEM-COD")
+    future.add_done_callback(lambda f: _registrar_resultado_email(codigo, f))
+    return None, "Envio de e-mail agendado"
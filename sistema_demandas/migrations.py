@@ -1,147 +1,419 @@
 # migrations.py
 
+import re
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from .config import get_db_config, _env_int
 from .db_connector import get_db_connection
 from .auth import hash_password
 
-def verificar_e_atualizar_tabela_usuarios():
-    """Verifica e atualiza a tabela de usuários (migração)."""
+# Ordem de prioridade materializada (Urgente=1 ... Baixa/outras=4), usada para ordenar
+PRIORIDADE_RANK_DDL = """SMALLINT GENERATED ALWAYS AS (
+    CASE prioridade
+        WHEN 'Urgente' THEN 1
+        WHEN 'Alta' THEN 2
+        WHEN 'Média' THEN 3
+        ELSE 4
+    END
+) STORED"""
+
+# Suba a cada mudança de esquema (tabelas, colunas, índices, views): bancos já na
+# versão atual pulam toda a migração no init_database.
+VERSAO_ESQUEMA = 4
+
+SQL_REGISTRAR_VERSAO = """
+    INSERT INTO versao_esquema (id, versao, aplicado_em)
+    VALUES (1, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (id) DO UPDATE SET versao = EXCLUDED.versao, aplicado_em = EXCLUDED.aplicado_em
+"""
+
+
+def _versao_aplicada():
+    """Versão de esquema gravada no banco (None se ainda não houver)."""
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('versao_esquema') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                return None
+            cur.execute("SELECT versao FROM versao_esquema WHERE id = 1")
+            linha = cur.fetchone()
+            return linha[0] if linha else None
+
+
+def _registrar_versao(cur) -> None:
+    """Grava VERSAO_ESQUEMA como aplicada (a tabela é criada se preciso)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS versao_esquema (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),
+            versao INTEGER NOT NULL,
+            aplicado_em TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute(SQL_REGISTRAR_VERSAO, (VERSAO_ESQUEMA,))
+
+
+def _colunas_por_tabela(cur, tabelas) -> dict:
+    """Lista numa única consulta ao catálogo as colunas de cada tabela ({tabela: {colunas}})."""
+    # pg_attribute direto (busca por attrelid) em vez da view information_schema.columns;
+    # to_regclass devolve NULL para tabela inexistente, que então fica sem colunas
+    cur.execute("""
+        SELECT t.nome, a.attname
+        FROM unnest(%s::text[]) AS t(nome)
+        JOIN pg_attribute a ON a.attrelid = to_regclass(t.nome)
+        WHERE a.attnum > 0 AND NOT a.attisdropped
+    """, (list(tabelas),))
+    colunas = {t: set() for t in tabelas}
+    for tabela, coluna in cur.fetchall():
+        colunas[tabela].add(coluna)
+    return colunas
+
+
+# Índices da aplicação: (nome, DDL). "{concorrente}" vira CONCURRENTLY nas atualizações
+# de um banco já em uso (o build não bloqueia escritas) e some no bootstrap.
+INDICES = (
+    ("uq_demandas_codigo", "CREATE UNIQUE INDEX {concorrente}IF NOT EXISTS uq_demandas_codigo ON demandas(codigo)"),
+    ("idx_demandas_solicitante",
+     "CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_solicitante ON demandas(solicitante)"),
+    ("idx_demandas_status", "CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_status ON demandas(status)"),
+    ("idx_demandas_prioridade", "CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_prioridade ON demandas(prioridade)"),
+    ("idx_demandas_data_criacao",
+     "CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_data_criacao ON demandas(data_criacao DESC)"),
+    ("idx_demandas_status_data",
+     "CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_status_data ON demandas(status, data_criacao DESC)"),
+    ("idx_usuarios_username_ativo",
+     "CREATE UNIQUE INDEX {concorrente}IF NOT EXISTS idx_usuarios_username_ativo ON usuarios(username) WHERE ativo"),
+    ("idx_usuarios_nome", "CREATE INDEX {concorrente}IF NOT EXISTS idx_usuarios_nome ON usuarios(nome)"),
+    # Coluna Pendente do Kanban
+    ("idx_demandas_pendentes_data", """
+        CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_pendentes_data
+        ON demandas(data_criacao DESC) WHERE status = 'Pendente'
+    """),
+)
+
+
+# Índices opcionais de trigramas para as buscas ILIKE '%...%': dependem da extensão
+# pg_trgm, então só são criados se ela estiver instalada e ficam fora da conferência
+# de versão (sem eles os filtros funcionam, só mais lentos).
+INDICES_TRGM = (
+    ("idx_demandas_solicitante_trgm", """
+        CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_solicitante_trgm
+        ON demandas USING GIN (solicitante gin_trgm_ops)
+    """),
+    ("idx_demandas_busca_trgm", """
+        CREATE INDEX {concorrente}IF NOT EXISTS idx_demandas_busca_trgm
+        ON demandas USING GIN ((item || ' ' || solicitante) gin_trgm_ops)
+    """),
+)
+
+
+# Índices de versões anteriores que não atendem mais nenhuma consulta (só custo de escrita)
+INDICES_OBSOLETOS = (
+    # Mesma chave de idx_demandas_data_criacao; as listagens leem todas as colunas,
+    # então o INCLUDE nunca gera index-only scan
+    "idx_demandas_data_criacao_cobertura",
+    # Nenhuma consulta ordena/filtra por (prioridade_rank, data_criacao)
+    "idx_demandas_prioridade_rank_data",
+)
+
+
+def _remover_indices_obsoletos(cur, concorrente: bool) -> None:
+    """Remove os índices de INDICES_OBSOLETOS (CONCURRENTLY num banco em uso)."""
+    for nome in INDICES_OBSOLETOS:
+        if concorrente:
+            try:
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}")
+            except Exception:
+                pass
+        else:
+            _executar_no_savepoint(cur, f"DROP INDEX IF EXISTS {nome}")
+
+
+def _criar_indices(cur, concorrente: bool, indices=INDICES) -> list:
+    """
+    Cria os índices de `indices` que faltam; um índice que falhe não impede os demais.
+    Com concorrente=True o cursor precisa estar em autocommit (CONCURRENTLY não roda
+    dentro de transação), um build interrompido é descartado para não ficar INVALID e
+    um índice INVALID deixado por execução anterior é removido e reconstruído.
+    Retorna os nomes dos índices que falharam.
+    """
+    falhas = []
+    if concorrente:
+        # IF NOT EXISTS pularia um índice INVALID de um build interrompido: descarta antes
+        for nome in _indices_invalidos(cur, [n for n, _ in indices]):
+            try:
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}")
+            except Exception:
+                pass
+        for nome, ddl in indices:
+            try:
+                cur.execute(ddl.format(concorrente="CONCURRENTLY "))
+            except Exception:
+                falhas.append(nome)
+                try:
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}")
+                except Exception:
+                    pass
+        return falhas
+
+    _remover_indices_obsoletos(cur, concorrente=False)
+    for nome, ddl in indices:
+        if _executar_no_savepoint(cur, ddl.format(concorrente="")) is not None:
+            falhas.append(nome)
+    return falhas
+
+
+def _indices_trgm(cur, concorrente: bool) -> tuple:
+    """
+    Tenta instalar pg_trgm e retorna INDICES_TRGM se a extensão estiver no banco;
+    sem ela avisa e retorna vazio. concorrente=True: cursor em autocommit (sem savepoint).
+    """
+    sql = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+    if concorrente:
+        try:
+            cur.execute(sql)
+        except Exception:
+            pass
+    else:
+        _executar_no_savepoint(cur, sql)
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    if cur.fetchone() is None:
+        st.warning("Aviso: extensão pg_trgm indisponível; buscas por texto seguem sem índices de trigramas.")
+        return ()
+    return INDICES_TRGM
+
+
+def _separar_falhas_trgm(falhas) -> list:
+    """Avisa as falhas dos índices opcionais (INDICES_TRGM) e retorna só as obrigatórias."""
+    opcionais = {nome for nome, _ in INDICES_TRGM}
+    for nome in falhas:
+        if nome in opcionais:
+            st.warning(f"Aviso: índice opcional {nome} não criado.")
+    return [nome for nome in falhas if nome not in opcionais]
+
+
+def _indices_invalidos(cur, nomes) -> list:
+    """Nomes de `nomes` que existem mas estão inválidos (pg_index.indisvalid = false)."""
+    cur.execute("""
+        SELECT n.nome
+        FROM unnest(%s::text[]) AS n(nome)
+        JOIN pg_index i ON i.indexrelid = to_regclass(n.nome)
+        WHERE NOT i.indisvalid
+    """, (list(nomes),))
+    return [r[0] for r in cur.fetchall()]
+
+
+def _indices_pendentes(cur) -> list:
+    """Nomes de INDICES que não existem ou estão inválidos (pg_index.indisvalid)."""
+    cur.execute("""
+        SELECT n.nome
+        FROM unnest(%s::text[]) AS n(nome)
+        LEFT JOIN pg_index i ON i.indexrelid = to_regclass(n.nome)
+        WHERE i.indisvalid IS NOT TRUE
+    """, ([nome for nome, _ in INDICES],))
+    return [r[0] for r in cur.fetchall()]
+
+
+def _indices_por_tabela(indices=INDICES) -> dict:
+    """Agrupa `indices` pela tabela indexada ({tabela: [(nome, ddl), ...]})."""
+    grupos = {}
+    for nome, ddl in indices:
+        tabela = re.search(r"\bON\s+(\w+)", ddl).group(1)
+        grupos.setdefault(tabela, []).append((nome, ddl))
+    return grupos
+
+
+def _criar_indices_tabela(indices) -> list:
+    """Worker de criar_indices: constrói, numa conexão própria, os índices de uma tabela (retorna as falhas)."""
+    # Sem sessão fixa atrás do PgBouncer, os SETs vazariam para outros clientes
+    ajustar_sessao = not get_db_config().get("pgbouncer")
+    with get_db_connection() as conn:
+        # CREATE INDEX CONCURRENTLY exige autocommit; o pool restaura o modo na próxima retirada
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            if ajustar_sessao:
+                # Workers paralelos do próprio PostgreSQL dentro de cada build (B-tree)
+                cur.execute("SET maintenance_work_mem = %s", (f"{_env_int('DB_INDEX_WORK_MEM_MB', 256)}MB",))
+                cur.execute("SET max_parallel_maintenance_workers = %s", (_env_int("DB_INDEX_WORKERS", 4),))
+            try:
+                return _criar_indices(cur, concorrente=True, indices=indices)
+            finally:
+                if ajustar_sessao:
+                    cur.execute("RESET maintenance_work_mem")
+                    cur.execute("RESET max_parallel_maintenance_workers")
+
+
+def criar_indices():
+    """
+    Cria os índices que faltam (CONCURRENTLY), ex.: após uma carga com pular_indices=True.
+    Dois CREATE INDEX CONCURRENTLY na mesma tabela se bloqueiam (SHARE UPDATE EXCLUSIVE),
+    então o paralelismo é entre tabelas: uma conexão por tabela.
+    """
     try:
         with get_db_connection() as conn:
+            conn.autocommit = True
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables
-                        WHERE table_name = 'usuarios'
-                    );
-                """)
-                existe = cur.fetchone()[0]
+                _remover_indices_obsoletos(cur, concorrente=True)
+                indices_trgm = _indices_trgm(cur, concorrente=True)
 
-                if not existe:
-                    cur.execute("""
-                        CREATE TABLE usuarios (
-                            id SERIAL PRIMARY KEY,
-                            nome VARCHAR(200) NOT NULL,
-                            email VARCHAR(200) UNIQUE NOT NULL,
-                            username VARCHAR(100) UNIQUE NOT NULL,
-                            senha_hash VARCHAR(255) NOT NULL,
-                            departamento VARCHAR(100),
-                            nivel_acesso VARCHAR(50) DEFAULT 'usuario',
-                            is_admin BOOLEAN DEFAULT FALSE,
-                            ativo BOOLEAN DEFAULT TRUE,
-                            data_cadastro TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                            ultimo_login TIMESTAMP WITH TIME ZONE,
-                            UNIQUE(username, email)
-                        )
-                    """)
-                    conn.commit()
-                    return True, "Tabela usuarios criada."
+        grupos = list(_indices_por_tabela(INDICES + indices_trgm).values())
+        falhas = []
+        with ThreadPoolExecutor(max_workers=len(grupos), thread_name_prefix="indices") as executor:
+            for futuro in [executor.submit(_criar_indices_tabela, g) for g in grupos]:
+                falhas.extend(futuro.result())
+        falhas = _separar_falhas_trgm(falhas)
 
-                cur.execute("""
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_name = 'usuarios'
-                """)
-                existentes = {r[0] for r in cur.fetchall()}
-
-                alteracoes = []
-                if "username" not in existentes:
-                    alteracoes.append("ADD COLUMN username VARCHAR(100) UNIQUE")
-                if "senha_hash" not in existentes:
-                    alteracoes.append("ADD COLUMN senha_hash VARCHAR(255) NOT NULL DEFAULT ''")
-                if "nivel_acesso" not in existentes:
-                    alteracoes.append("ADD COLUMN nivel_acesso VARCHAR(50) DEFAULT 'usuario'")
-                if "ativo" not in existentes:
-                    alteracoes.append("ADD COLUMN ativo BOOLEAN DEFAULT TRUE")
-                if "ultimo_login" not in existentes:
-                    alteracoes.append("ADD COLUMN ultimo_login TIMESTAMP WITH TIME ZONE")
-
-                for alt in alteracoes:
-                    try:
-                        cur.execute(f"ALTER TABLE usuarios {alt}")
-                    except Exception as e:
-                        st.warning(f"Aviso alterando usuarios: {str(e)}")
-
-                if "username" not in existentes:
-                    cur.execute("""
-                        UPDATE usuarios
-                        SET username = LOWER(REPLACE(nome, ' ', '_')) || '_' || id::text
-                        WHERE username IS NULL OR username = ''
-                    """)
+        # Confere no catálogo: todos existem e estão válidos
+        with get_db_connection(readonly=True) as conn:
+            with conn.cursor() as cur:
+                pendentes = sorted(set(falhas) | set(_indices_pendentes(cur)))
+        if pendentes:
+            return False, f"Erro índices: não criados ou inválidos: {', '.join(pendentes)}"
+        return True, "Índices OK."
+    except Exception as e:
+        return False, f"Erro índices: {str(e)}"
 
-                conn.commit()
-                return True, "Tabela usuarios OK."
+
+def _executar_no_savepoint(cur, sql: str):
+    """Executa `sql` isolado num savepoint; retorna a exceção (ou None) sem abortar a transação."""
+    cur.execute("SAVEPOINT sp_alterar")
+    try:
+        cur.execute(sql)
+        erro = None
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT sp_alterar")
+        erro = e
+    cur.execute("RELEASE SAVEPOINT sp_alterar")
+    return erro
+
+
+def _alterar_tabela(cur, tabela: str, alteracoes: list) -> None:
+    """
+    Aplica as alterações num único ALTER TABLE (um lock e uma reescrita da tabela).
+    Se o lote falhar, volta ao savepoint e aplica uma a uma, avisando as que falharem.
+    """
+    if not alteracoes:
+        return
+    if _executar_no_savepoint(cur, f"ALTER TABLE {tabela} {', '.join(alteracoes)}") is None:
+        return
+    for alt in alteracoes:
+        erro = _executar_no_savepoint(cur, f"ALTER TABLE {tabela} {alt}")
+        if erro is not None:
+            st.warning(f"Aviso alterando {tabela}: {str(erro)}")
+
+
+def verificar_e_atualizar_tabela_usuarios(cur, colunas: set = None):
+    """
+    Verifica e atualiza a tabela de usuários (migração) no cursor dado, sem commit.
+    `colunas` (já lidas por _colunas_por_tabela) evita nova consulta ao catálogo;
+    conjunto vazio significa tabela inexistente.
+    """
+    try:
+        if colunas is None:
+            colunas = _colunas_por_tabela(cur, ["usuarios"])["usuarios"]
+        existe = bool(colunas)
+
+        if not existe:
+            cur.execute("""
+                CREATE TABLE usuarios (
+                    id SERIAL PRIMARY KEY,
+                    nome VARCHAR(200) NOT NULL,
+                    email VARCHAR(200) UNIQUE NOT NULL,
+                    username VARCHAR(100) UNIQUE NOT NULL,
+                    senha_hash VARCHAR(255) NOT NULL,
+                    departamento VARCHAR(100),
+                    nivel_acesso VARCHAR(50) DEFAULT 'usuario',
+                    is_admin BOOLEAN DEFAULT FALSE,
+                    ativo BOOLEAN DEFAULT TRUE,
+                    data_cadastro TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    ultimo_login TIMESTAMP WITH TIME ZONE,
+                    UNIQUE(username, email)
+                )
+            """)
+            return True, "Tabela usuarios criada."
+
+        existentes = colunas
+
+        alteracoes = []
+        if "username" not in existentes:
+            alteracoes.append("ADD COLUMN username VARCHAR(100) UNIQUE")
+        if "senha_hash" not in existentes:
+            alteracoes.append("ADD COLUMN senha_hash VARCHAR(255) NOT NULL DEFAULT ''")
+        if "nivel_acesso" not in existentes:
+            alteracoes.append("ADD COLUMN nivel_acesso VARCHAR(50) DEFAULT 'usuario'")
+        if "ativo" not in existentes:
+            alteracoes.append("ADD COLUMN ativo BOOLEAN DEFAULT TRUE")
+        if "ultimo_login" not in existentes:
+            alteracoes.append("ADD COLUMN ultimo_login TIMESTAMP WITH TIME ZONE")
+
+        _alterar_tabela(cur, "usuarios", alteracoes)
+
+        if "username" not in existentes:
+            # Coluna recém-criada: todas as linhas estão NULL (não há '' a tratar)
+            cur.execute("""
+                UPDATE usuarios
+                SET username = LOWER(REPLACE(nome, ' ', '_')) || '_' || id::text
+                WHERE username IS NULL
+            """)
+            # Estatísticas frescas após reescrever a tabela inteira (VACUUM não roda em transação)
+            cur.execute("ANALYZE usuarios")
+
+        return True, "Tabela usuarios OK."
     except Exception as e:
         return False, f"Erro usuarios: {str(e)}"
 
 
-def verificar_e_atualizar_tabela_demandas():
-    """Verifica e atualiza a tabela de demandas (migração)."""
+def verificar_e_atualizar_tabela_demandas(cur, colunas: set = None):
+    """Verifica e atualiza a tabela de demandas (migração); mesmas regras de usuarios."""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables
-                        WHERE table_name = 'demandas'
-                    );
-                """)
-                existe = cur.fetchone()[0]
-                if not existe:
-                    # A tabela será criada no init_database, apenas retorna OK
-                    return True, "Tabela demandas será criada."
-
-                cur.execute("""
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_name = 'demandas'
-                """)
-                existentes = {r[0] for r in cur.fetchall()}
-
-                alters = []
-                if "local" not in existentes:
-                    alters.append("ADD COLUMN local VARCHAR(100) DEFAULT 'Gerência'")
-                if "unidade" not in existentes:
-                    alters.append("ADD COLUMN unidade VARCHAR(50) DEFAULT 'Unid.'")
-                if "codigo" not in existentes:
-                    alters.append("ADD COLUMN codigo VARCHAR(20)")
-
-                if "almoxarifado" not in existentes:
-                    alters.append("ADD COLUMN almoxarifado BOOLEAN DEFAULT FALSE")
-                if "valor" not in existentes:
-                    alters.append("ADD COLUMN valor DECIMAL(12,2)")
-
-                for alt in alters:
-                    try:
-                        cur.execute(f"ALTER TABLE demandas {alt}")
-                    except Exception as e:
-                        st.warning(f"Aviso alterando demandas: {str(e)}")
+        if colunas is None:
+            colunas = _colunas_por_tabela(cur, ["demandas"])["demandas"]
+        existe = bool(colunas)
+        if not existe:
+            # A tabela será criada no init_database, apenas retorna OK
+            return True, "Tabela demandas será criada."
 
-                try:
-                    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_demandas_codigo ON demandas(codigo)")
-                except Exception:
-                    pass
+        existentes = colunas
 
-                try:
-                    cur.execute("CREATE INDEX IF NOT EXISTS idx_demandas_solicitante ON demandas(solicitante)")
-                except Exception:
-                    pass
+        alters = []
+        if "local" not in existentes:
+            alters.append("ADD COLUMN local VARCHAR(100) DEFAULT 'Gerência'")
+        if "unidade" not in existentes:
+            alters.append("ADD COLUMN unidade VARCHAR(50) DEFAULT 'Unid.'")
+        if "codigo" not in existentes:
+            alters.append("ADD COLUMN codigo VARCHAR(20)")
 
-                conn.commit()
-                return True, "Tabela demandas OK."
+        if "almoxarifado" not in existentes:
+            alters.append("ADD COLUMN almoxarifado BOOLEAN DEFAULT FALSE")
+        if "valor" not in existentes:
+            alters.append("ADD COLUMN valor DECIMAL(12,2)")
+        if "prioridade_rank" not in existentes:
+            alters.append(f"ADD COLUMN prioridade_rank {PRIORIDADE_RANK_DDL}")
+
+        _alterar_tabela(cur, "demandas", alters)
+
+        return True, "Tabela demandas OK."
     except Exception as e:
         return False, f"Erro demandas: {str(e)}"
 
 
-def init_database():
-    """Inicializa o banco de dados, criando tabelas e o usuário admin padrão."""
+def init_database(pular_indices: bool = False):
+    """
+    Inicializa o banco de dados, criando tabelas, índices e o usuário admin padrão.
+    Com pular_indices=True (carga inicial em massa) os índices ficam para depois:
+    chame criar_indices() ao fim da carga.
+    """
     try:
+        if _versao_aplicada() == VERSAO_ESQUEMA:
+            return True, "✅ Banco já atualizado."
+
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'America/Fortaleza'")
+                # Colunas das duas tabelas lidas numa só consulta (antes de criar as tabelas)
+                colunas = _colunas_por_tabela(cur, ["demandas", "usuarios"])
+                concorrente = bool(colunas["demandas"])
 
-                # Criação da tabela demandas (se não existir)
-                cur.execute("""
+                # Criação das tabelas (se não existirem) num único envio ao servidor
+                cur.execute(f"""
                     CREATE TABLE IF NOT EXISTS demandas (
                         id SERIAL PRIMARY KEY,
                         codigo VARCHAR(20),
@@ -160,12 +432,10 @@ def init_database():
                         urgencia BOOLEAN DEFAULT FALSE,
                         estimativa_horas DECIMAL(5,2),
                         almoxarifado BOOLEAN DEFAULT FALSE,
-                        valor DECIMAL(12,2)
-                    )
-                """)
+                        valor DECIMAL(12,2),
+                        prioridade_rank {PRIORIDADE_RANK_DDL}
+                    );
 
-                # Criação da tabela historico_demandas (se não existir)
-                cur.execute("""
                     CREATE TABLE IF NOT EXISTS historico_demandas (
                         id SERIAL PRIMARY KEY,
                         demanda_id INTEGER REFERENCES demandas(id) ON DELETE CASCADE,
@@ -173,39 +443,88 @@ def init_database():
                         acao VARCHAR(100),
                         detalhes JSONB,
                         data_acao TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                    );
+
+                    -- Contador diário dos códigos ddmmaa-xx (ver gerar_codigos_demanda)
+                    CREATE TABLE IF NOT EXISTS contador_codigos (
+                        prefixo VARCHAR(10) PRIMARY KEY,
+                        ultimo INTEGER NOT NULL
                     )
                 """)
 
-                # Aplica migrações
-                ok_d, msg_d = verificar_e_atualizar_tabela_demandas()
+                # Aplica migrações; numa falha, get_db_connection desfaz tudo ao devolver a conexão
+                ok_d, msg_d = verificar_e_atualizar_tabela_demandas(cur, colunas["demandas"])
                 if not ok_d:
-                    conn.rollback()
                     return False, msg_d
 
-                ok_u, msg_u = verificar_e_atualizar_tabela_usuarios()
+                ok_u, msg_u = verificar_e_atualizar_tabela_usuarios(cur, colunas["usuarios"])
                 if not ok_u:
-                    conn.rollback()
                     return False, msg_u
 
-                # Cria índices
+                # Pré-agregação das estatísticas sem filtros de texto/data (ver obter_estatisticas).
+                # O índice único permite REFRESH ... CONCURRENTLY sem bloquear leituras.
+                # `dia` (data local de Fortaleza) permite filtrar por período somando os dias.
+                cur.execute("SAVEPOINT sp_mv_estatisticas")
                 try:
-                    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_demandas_codigo ON demandas(codigo)")
-                    cur.execute("CREATE INDEX IF NOT EXISTS idx_demandas_status ON demandas(status)")
-                    cur.execute("CREATE INDEX IF NOT EXISTS idx_demandas_prioridade ON demandas(prioridade)")
-                    cur.execute("CREATE INDEX IF NOT EXISTS idx_demandas_data_criacao ON demandas(data_criacao DESC)")
+                    colunas_mv = _colunas_por_tabela(cur, ["mv_demandas_estatisticas"])["mv_demandas_estatisticas"]
+                    if colunas_mv and "dia" not in colunas_mv:
+                        # Versão antiga da view, sem o dia: recria
+                        cur.execute("DROP MATERIALIZED VIEW mv_demandas_estatisticas")
+                    cur.execute("""
+                        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_demandas_estatisticas AS
+                        SELECT (data_criacao AT TIME ZONE 'America/Fortaleza')::date as dia,
+                               departamento, prioridade, prioridade_rank, status, urgencia,
+                               COUNT(*) as n,
+                               SUM(quantidade) as itens,
+                               SUM(valor) as valor
+                        FROM demandas
+                        GROUP BY 1, departamento, prioridade, prioridade_rank, status, urgencia
+                    """)
+                    cur.execute("""
+                        CREATE UNIQUE INDEX IF NOT EXISTS uq_mv_demandas_estatisticas
+                        ON mv_demandas_estatisticas(dia, departamento, prioridade, status, urgencia)
+                    """)
+                    cur.execute("RELEASE SAVEPOINT sp_mv_estatisticas")
                 except Exception:
-                    pass
+                    cur.execute("ROLLBACK TO SAVEPOINT sp_mv_estatisticas")
 
                 # Cria usuário admin padrão se não existir
-                cur.execute("SELECT COUNT(*) FROM usuarios WHERE username = 'admin'")
-                if cur.fetchone()[0] == 0:
+                # Sonda de existência (para no primeiro registro); o hash só é gerado se precisar
+                cur.execute("SELECT 1 FROM usuarios WHERE username = 'admin' LIMIT 1")
+                if cur.fetchone() is None:
                     admin_hash = hash_password("admin123")
                     cur.execute("""
                         INSERT INTO usuarios (nome, email, username, senha_hash, nivel_acesso, is_admin, ativo)
                         VALUES (%s, %s, %s, %s, %s, %s, %s)
                     """, ("Administrador Principal", "admin@sistema.com", "admin", admin_hash, "administrador", True, True))
 
+                # Índices só no fim, já sobre o estado final dos dados (backfills e seed).
+                # Banco novo: na própria transação. Banco em uso: CONCURRENTLY, após o commit.
+                # A versão só é gravada com todos os índices válidos; senão a migração
+                # (e a criação dos índices) roda de novo no próximo boot.
+                pendentes = None
+                if not concorrente and not pular_indices:
+                    indices = INDICES + _indices_trgm(cur, concorrente=False)
+                    _separar_falhas_trgm(_criar_indices(cur, concorrente=False, indices=indices))
+                    pendentes = _indices_pendentes(cur)
+                    if not pendentes:
+                        _registrar_versao(cur)
+
                 conn.commit()
+
+        if pendentes:
+            return False, f"Erro índices: não criados ou inválidos: {', '.join(pendentes)}"
+        if pular_indices:
+            return True, "✅ Banco inicializado (índices pendentes: chame criar_indices())."
+        if concorrente:
+            ok_i, msg_i = criar_indices()
+            if not ok_i:
+                return False, msg_i
+            # Só depois dos índices válidos: uma falha acima faz a migração rodar de novo no próximo boot
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    _registrar_versao(cur)
+                    conn.commit()
         return True, "✅ Banco inicializado."
     except Exception as e:
         return False, f"❌ Erro init: {str(e)}"
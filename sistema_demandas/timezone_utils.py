@@ -1,7 +1,7 @@
 # timezone_utils.py
 
-from datetime import datetime, date, timedelta
-import pytz
+from datetime import datetime, date, timedelta, timezone
+from functools import lru_cache
 from .config import FORTALEZA_TZ
 
 def agora_fortaleza() -> datetime:
@@ -15,27 +15,25 @@ def converter_para_fortaleza(dt: datetime) -> datetime:
         return None
     if dt.tzinfo is None:
         # Assume UTC se não tiver fuso horário (comportamento do código original)
-        dt = pytz.utc.localize(dt)
+        dt = dt.replace(tzinfo=timezone.utc)
+    elif dt.tzinfo is FORTALEZA_TZ:
+        # Já está em Fortaleza, não precisa converter
+        return dt
     return dt.astimezone(FORTALEZA_TZ)
 
 
-def formatar_data_hora_fortaleza(dt: datetime, formato: str = "%d/%m/%Y %H:%M") -> str:
-    """Formata um objeto datetime para string no fuso horário de Fortaleza."""
-    if not dt:
-        return ""
-    return converter_para_fortaleza(dt).strftime(formato)
-
-
+@lru_cache(maxsize=1024)
 def _to_tz_aware_start(d: date) -> datetime:
     """Retorna o início do dia (00:00:00) da data em Fortaleza."""
     if not d:
         return None
-    return FORTALEZA_TZ.localize(datetime(d.year, d.month, d.day, 0, 0, 0))
+    return datetime(d.year, d.month, d.day, 0, 0, 0, tzinfo=FORTALEZA_TZ)
 
 
+@lru_cache(maxsize=1024)
 def _to_tz_aware_end_exclusive(d: date) -> datetime:
     """Retorna o início do dia seguinte (00:00:00) da data em Fortaleza."""
     if not d:
         return None
     dd = d + timedelta(days=1)
-    return FORTALEZA_TZ.localize(datetime(dd.year, dd.month, dd.day, 0, 0, 0))
+    return datetime(dd.year, dd.month, dd.day, 0, 0, 0, tzinfo=FORTALEZA_TZ)
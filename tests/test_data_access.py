@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+
+from sistema_demandas import data_access
+
+
+class ConexaoFalsa:
+    def __init__(self):
+        self.comandos = []
+        self.commits = 0
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql, params=None):
+        self.comandos.append((sql, params))
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_logins_enfileirados_sao_gravados_num_lote(monkeypatch):
+    conn = ConexaoFalsa()
+
+    @contextmanager
+    def conexao_falsa(readonly=False):
+        yield conn
+
+    monkeypatch.setattr(data_access, "get_db_connection", conexao_falsa)
+    for usuario_id in (3, 1, 3, 2):
+        data_access._fila_logins.put(usuario_id)
+
+    data_access._gravar_lote_logins()
+
+    assert conn.comandos == [(data_access.SQL_REGISTRAR_LOGINS, ([1, 2, 3],))]
+    assert conn.commits == 1
+    assert data_access._fila_logins.empty()
@@ -0,0 +1,45 @@
+from sistema_demandas import migrations
+
+
+class CursorFalso:
+    """Cursor mínimo: registra os comandos e responde às consultas de pg_index."""
+
+    def __init__(self, invalidos=()):
+        self.invalidos = list(invalidos)
+        self.comandos = []
+        self._resultado = []
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.comandos.append(sql)
+        if "NOT i.indisvalid" in sql:
+            self._resultado = [(n,) for n in params[0] if n in self.invalidos]
+            return
+        if sql.startswith("DROP INDEX CONCURRENTLY IF EXISTS "):
+            nome = sql.rsplit(" ", 1)[1]
+            if nome in self.invalidos:
+                self.invalidos.remove(nome)
+        self._resultado = []
+
+    def fetchall(self):
+        return self._resultado
+
+
+def test_indice_invalido_e_reconstruido():
+    cur = CursorFalso(invalidos=["idx_demandas_status"])
+
+    falhas = migrations._criar_indices(cur, concorrente=True)
+
+    assert falhas == []
+    drop = "DROP INDEX CONCURRENTLY IF EXISTS idx_demandas_status"
+    create = next(c for c in cur.comandos if c.startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_demandas_status "))
+    assert cur.comandos.index(drop) < cur.comandos.index(create)
+    assert cur.invalidos == []
+
+
+def test_indice_valido_nao_e_removido():
+    cur = CursorFalso()
+
+    migrations._criar_indices(cur, concorrente=True)
+
+    assert not any(c.startswith("DROP INDEX") for c in cur.comandos)